@@ -5,14 +5,16 @@ gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 
 
-from gi.repository import Gtk, Gdk, Adw
+from gi.repository import Gtk, Gdk, Adw, GLib
 from boxflat.panels import *
 from boxflat.connection_manager import MozaConnectionManager
 from boxflat.hid_handler import HidHandler
 from boxflat.settings_handler import SettingsHandler
+from boxflat import tracing
 from threading import Thread, Event
 
 import os
+import signal
 import subprocess
 
 class MainWindow(Adw.ApplicationWindow):
@@ -131,8 +133,13 @@ class MainWindow(Adw.ApplicationWindow):
 
 
 class MyApp(Adw.Application):
-    def __init__(self, data_path: str, config_path: str, dry_run: bool, custom: bool, autostart: bool,**kwargs):
+    def __init__(self, data_path: str, config_path: str, dry_run: bool, custom: bool, autostart: bool,
+                 serial_path="/dev/serial/by-id", record_path: str=None, stats_path: str=None,
+                 trace_path: str=None, **kwargs):
         super().__init__(**kwargs)
+        if trace_path:
+            tracing.start(trace_path)
+
         self.connect('activate', self.on_activate)
 
         self.Tray = None
@@ -152,7 +159,14 @@ class MyApp(Adw.Application):
         self._data_path = data_path
         self._held = Event()
 
-        self._cm = MozaConnectionManager(os.path.join(data_path, "serial.yml"), dry_run)
+        self._cm = MozaConnectionManager(os.path.join(data_path, "serial.yml"), dry_run, serial_path, config_path)
+        self._cm.load_fingerprints(config_path)
+        if record_path:
+            self._cm.start_recording(record_path)
+
+        self._stats_path = stats_path
+        if stats_path:
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self._dump_stats)
         self._cm.subscribe("hid-device-connected", self._hid_handler.add_device)
         self._cm.subscribe("hid-device-disconnected", self._hid_handler.remove_device)
 
@@ -193,8 +207,10 @@ class MyApp(Adw.Application):
             box2.append(button)
 
         navigation.set_content(self._activate_default().content)
+        self._cm.restore_fingerprints()
 
         self._cm.subscribe("estop-receive-status", self._cm.set_setting, "base-ffb-disable")
+        self._cm.pin_polling("estop-get-status")
 
 
     def hold(self) -> None:
@@ -224,6 +240,7 @@ class MyApp(Adw.Application):
             self.hold()
 
         if autostart and hidden and background:
+            self._cm.set_window_visible(False)
             return
 
         if self.navigation.get_root() != None:
@@ -233,6 +250,8 @@ class MyApp(Adw.Application):
         win.set_application(app)
         win.connect("close-request", lambda *_: Thread(target=self._show_bg_notification, daemon=True).start())
         win.connect("close-request", self._save_window_info)
+        win.connect("close-request", lambda *_: self._cm.set_window_visible(False))
+        win.connect("notify::visible", lambda win, *_: self._cm.set_window_visible(win.get_visible()))
 
         win.present()
         win.check_udev(self._data_path)
@@ -287,6 +306,8 @@ class MyApp(Adw.Application):
             return
 
         self.navigation.set_content(new_content)
+        for title, panel in self._panels.items():
+            panel.set_shown(title == new_title)
 
 
     def set_content_title(self, title: str):
@@ -335,11 +356,20 @@ class MyApp(Adw.Application):
         for panel in self._panels.values():
             panel.shutdown()
 
+        if self._stats_path:
+            self._dump_stats()
         self._cm.shutdown()
+        tracing.stop()
+
+
+    def _dump_stats(self, *_) -> bool:
+        self._cm.dump_serial_stats(self._stats_path)
+        return GLib.SOURCE_CONTINUE
 
 
     def _activate_default(self) -> SettingsPanel:
         self._panels["Home"].button.set_active(True)
+        self._panels["Home"].set_shown(True)
         return self._panels["Home"]
 
 
@@ -0,0 +1,171 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+from threading import Lock
+from time import monotonic
+
+CAP_BACKOFF_MIN=1
+CAP_BACKOFF_MAX=30
+
+# Timeouts before a command that answered before is backed off as well,
+# one more than the routing table needs to try another port
+CAP_SUPPORTED_MISSES=4
+
+# Consecutive timeouts before a command isn't retried right away anymore
+CAP_UNSUPPORTED_MISSES=2
+
+
+class Capability():
+    __slots__ = ("supported", "failures", "retry_at")
+
+    def __init__(self):
+        self.supported = False
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+
+class DeviceCapabilities():
+    """
+    Which commands of one device answer and which ones don't
+    """
+    def __init__(self):
+        self.commands: dict[str, Capability] = {}
+        self.supported = 0
+
+
+    def get(self, command_name: str) -> Capability:
+        capability = self.commands.get(command_name)
+        if capability is None:
+            capability = Capability()
+            self.commands[command_name] = capability
+        return capability
+
+
+    def clear_failures(self) -> None:
+        for capability in self.commands.values():
+            capability.failures = 0
+            capability.retry_at = 0.0
+
+
+
+class CapabilityMap():
+    """
+    Negative cache of commands a device doesn't implement.
+    Unanswered reads are backed off exponentially instead of paying
+    the full read timeout every time. Reset when a device reconnects.
+    """
+    def __init__(self):
+        self._devices: dict[str, DeviceCapabilities] = {}
+        self._lock = Lock()
+        self.skipped = 0
+
+
+    def _device(self, command_name: str) -> DeviceCapabilities:
+        device_name = command_name.split("-", maxsplit=1)[0]
+        device = self._devices.get(device_name)
+        if device is None:
+            device = DeviceCapabilities()
+            self._devices[device_name] = device
+        return device
+
+
+    def record_response(self, command_name: str) -> None:
+        with self._lock:
+            device = self._device(command_name)
+
+            # Device just came back, whatever failed before gets another chance
+            if device.supported == 0:
+                device.clear_failures()
+
+            capability = device.get(command_name)
+            if not capability.supported:
+                capability.supported = True
+                device.supported += 1
+
+            capability.failures = 0
+            capability.retry_at = 0.0
+
+
+    def record_timeout(self, command_name: str) -> None:
+        with self._lock:
+            device = self._device(command_name)
+            capability = device.get(command_name)
+            capability.failures += 1
+
+            if capability.supported:
+                if capability.failures < CAP_SUPPORTED_MISSES:
+                    return
+
+                capability.supported = False
+                device.supported -= 1
+                capability.failures = 1
+
+            backoff = min(CAP_BACKOFF_MIN * 2 ** (capability.failures - 1), CAP_BACKOFF_MAX)
+            capability.retry_at = monotonic() + backoff
+
+
+    def is_supported(self, command_name: str) -> bool:
+        """
+        Answered before and not backed off since
+        """
+        device = self._devices.get(command_name.split("-", maxsplit=1)[0])
+        if device is None:
+            return False
+
+        capability = device.commands.get(command_name)
+        return capability is not None and capability.supported
+
+
+    def is_unsupported(self, command_name: str) -> bool:
+        """
+        Known not to answer, so a lost frame isn't worth retrying
+        """
+        device = self._devices.get(command_name.split("-", maxsplit=1)[0])
+        if device is None:
+            return False
+
+        capability = device.commands.get(command_name)
+        if capability is None or capability.supported:
+            return False
+        return capability.failures >= CAP_UNSUPPORTED_MISSES
+
+
+    def should_skip(self, command_name: str) -> bool:
+        device = self._devices.get(command_name.split("-", maxsplit=1)[0])
+        if device is None:
+            return False
+
+        capability = device.commands.get(command_name)
+        if capability is None or capability.supported or capability.failures == 0:
+            return False
+
+        if monotonic() >= capability.retry_at:
+            return False
+
+        self.skipped += 1
+        return True
+
+
+    def reset_device(self, device_name: str) -> None:
+        with self._lock:
+            self._devices.pop(device_name, None)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._devices.clear()
+
+
+    def snapshot(self) -> dict[str, dict[str, bool]]:
+        """
+        Per device: command -> True if it answered, False if it's backed off
+        """
+        with self._lock:
+            return {
+                device_name: {
+                    command_name: capability.supported
+                    for command_name, capability in device.commands.items()
+                    if capability.supported or capability.failures > 0
+                }
+                for device_name, device in self._devices.items()
+            }
@@ -0,0 +1,392 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+"""
+Conformance check and benchmark of the Moza codec.
+
+Every serial.yml command of every device is encoded with sample values
+of its type, parsed back, answered like a device would and decoded again.
+Frames come from the command templates the connection manager uses and
+have to be byte-identical to the ones the plain MozaCommand path builds.
+Any round trip that doesn't give back the original value is reported.
+Then encode, decode and full response dispatch are timed in frames/sec
+and compared against the baseline committed next to this file.
+
+python -m boxflat.codec_benchmark [--save-baseline] [--tolerance 0.15]
+"""
+
+import os
+import yaml
+import argparse
+from time import perf_counter
+from .bitwise import swap_nibbles
+from .serial_handler import MozaFrameParser
+from .subscription import EventDispatcher
+from .moza_command import *
+
+BENCH_BASELINE = os.path.join(os.path.dirname(__file__), "codec-baseline.yml")
+BENCH_TOLERANCE = 0.15
+BENCH_MIN_TIME = 0.2
+BENCH_ROUNDS = 3
+BENCH_CHUNK_SIZE = 64
+
+BENCH_FLOATS = (0.0, 1.5, -42.25, 65504.0)
+
+
+def sample_values(value_type: str, length: int) -> list:
+    if value_type == "int":
+        pattern = int.from_bytes(bytes(range(1, length + 1)))
+        return sorted({0, 1, pattern, 2 ** (8 * length) - 1})
+
+    elif value_type == "float":
+        return list(BENCH_FLOATS)
+
+    elif value_type == "array":
+        return [list(range(length)), [255] * length]
+
+    elif value_type == "hex":
+        return [bytes(range(length)).hex(), "ff" * length]
+
+    return []
+
+
+
+class CodecCase():
+    __slots__ = ("event", "command", "legacy", "value", "rw", "frame", "response")
+
+    def __init__(self, event: str, command: MozaCommand, legacy: MozaCommand, value, rw: int):
+        self.event = event
+        self.command = command
+        self.legacy = legacy
+        self.value = value
+        self.rw = rw
+        self.frame = None
+        self.response = None
+
+
+
+class CodecBenchmark():
+    """
+    Builds one case per command, direction and sample value.
+    Responses are generated the way devices send them:
+    response bit set on the group and nibbles of the device id swapped.
+    """
+    def __init__(self, serial_data: dict):
+        self._start = int(serial_data["message-start"])
+        self._magic = int(serial_data["magic-value"])
+        self._commands = serial_data["commands"]
+        self._device_ids = serial_data["device-ids"]
+        self._ids_to_names = serial_data["ids-to-names"]
+        self._decoder = MozaResponseDecoder(self._commands, self._ids_to_names)
+        self._templates = MozaCommandTemplates(self._commands, self._start, self._magic)
+
+        self.cases: list[CodecCase] = []
+        self.failures: list[str] = []
+        self.aliases = 0
+        self.unsolicited = 0
+
+        for device_name, commands in self._commands.items():
+            for name, data in commands.items():
+                self._add_cases(device_name, name, data)
+
+
+    def _add_cases(self, device_name: str, name: str, data: dict) -> None:
+        for rw, group in ((MOZA_COMMAND_READ, "read"), (MOZA_COMMAND_WRITE, "write")):
+            if int(data[group]) == -1:
+                continue
+
+            for value in sample_values(data["type"], int(data["bytes"])):
+                command = self._templates.command(device_name, name)
+                command.device_id = int(self._device_ids[device_name])
+
+                legacy = MozaCommand()
+                legacy.set_data_from_name(name, self._commands, device_name)
+                legacy.device_id = command.device_id
+                self.cases.append(CodecCase(f"{device_name}-{name}", command, legacy, value, rw))
+
+
+    def _response(self, case: CodecCase) -> bytes:
+        command = case.command
+        group = command.read_group if case.rw == MOZA_COMMAND_READ else command.write_group
+
+        response = bytearray((self._start, command.length,
+            group | (1 << MOZA_RESPONSE_BIT), swap_nibbles(command.device_id)))
+        response.extend(command.id_bytes)
+        response.extend(command.payload)
+        response.append(command.checksum(response, self._magic))
+        return bytes(response)
+
+
+    def _equal(self, case: CodecCase, value) -> bool:
+        if case.command.type == "hex" and isinstance(value, str):
+            return value == case.value.lower()
+        return value == case.value
+
+
+    def _shadowed(self, case: CodecCase, event: str) -> bool:
+        """
+        Another command of the same device shares group and id,
+        the decoder can only ever return the first one
+        """
+        command = case.command
+        device_name, name = event.split("-", maxsplit=1)
+        other = self._commands.get(device_name, {}).get(name)
+        if other is None or event == case.event:
+            return False
+
+        group = "read" if case.rw == MOZA_COMMAND_READ else "write"
+        return (other[group] == self._commands[command.device_type][command.name][group]
+            and bytes(other["id"]) == command.id_bytes)
+
+
+    def check(self) -> bool:
+        """
+        Encode, parse and decode every case, collect what doesn't match
+        """
+        self.failures.clear()
+        self.aliases = 0
+        self.unsolicited = 0
+        parser = MozaFrameParser(self._start, self._magic)
+
+        for case in self.cases:
+            command = case.command
+            command.set_payload(case.value)
+            case.frame = command.prepare_message(self._start, case.rw, self._magic)
+            case.response = self._response(case)
+            direction = "read" if case.rw == MOZA_COMMAND_READ else "write"
+            label = f"{case.event} {direction} {case.value!r}"
+
+            if len(command.payload) != command.payload_length:
+                self.failures.append(f"{label}: payload is {len(command.payload)} bytes, expected {command.payload_length}")
+                continue
+
+            case.legacy.set_payload(case.value)
+            legacy = case.legacy.prepare_message(self._start, case.rw, self._magic)
+            if case.frame != legacy:
+                self.failures.append(f"{label}: template frame {case.frame.hex(':')}, legacy {legacy.hex(':')}")
+                continue
+
+            value = MozaCommand.value_from_data(command.payload, command.type, command.payload_length)
+            if not self._equal(case, value):
+                self.failures.append(f"{label}: payload decodes to {value!r}")
+                continue
+
+            parser.feed(case.frame)
+            frames = parser.frames()
+            if len(frames) != 1 or bytes(frames[0]) != case.frame[2:-1]:
+                self.failures.append(f"{label}: frame {case.frame.hex(':')} doesn't parse back")
+                continue
+
+            # Read group already has the response bit, the device sends these
+            # on its own and never answers a request for them
+            if case.rw == MOZA_COMMAND_READ and command.read_group & (1 << MOZA_RESPONSE_BIT):
+                self.unsolicited += 1
+                continue
+
+            parser.feed(case.response)
+            body = bytes(parser.frames()[0])
+            device_name = command.device_type
+
+            if case.rw == MOZA_COMMAND_WRITE:
+                entry = self._decoder.decode_ack(body, device_name)
+                event = entry.event if entry is not None else None
+                if event != case.event:
+                    if event is not None and self._shadowed(case, event):
+                        self.aliases += 1
+                        continue
+                    self.failures.append(f"{label}: acknowledged as {event}")
+                continue
+
+            event, value = self._decoder.decode(body, device_name)
+            reference = MozaCommand.value_from_response(body, device_name, self._commands, self._ids_to_names)
+
+            if reference != (event, value):
+                self.failures.append(f"{label}: decoder gives {event}={value!r}, reference {reference[0]}={reference[1]!r}")
+                continue
+
+            # Legitimately reported as the hpattern shifter
+            if case.event.endswith("-output-y") and event == f"hpattern-{command.name}":
+                event = case.event
+
+            if event != case.event:
+                if event is not None and self._shadowed(case, event):
+                    self.aliases += 1
+                    continue
+                self.failures.append(f"{label}: decoded as {event}")
+                continue
+
+            if not self._equal(case, value):
+                self.failures.append(f"{label}: response decodes to {value!r}")
+
+        return not self.failures
+
+
+    @staticmethod
+    def _measure(function, count: int, min_time=BENCH_MIN_TIME, rounds=BENCH_ROUNDS) -> float:
+        """
+        Best frames/sec out of a few rounds
+        """
+        best = 0.0
+        for _ in range(rounds):
+            done = 0
+            start = perf_counter()
+            while True:
+                function()
+                done += count
+                elapsed = perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            best = max(best, done / elapsed)
+        return best
+
+
+    def benchmark(self, min_time=BENCH_MIN_TIME, rounds=BENCH_ROUNDS) -> dict[str, float]:
+        """
+        Frames/sec of encoding (templates and plain commands), decoding
+        and full response dispatch.
+        Run check() first so every case has its frames.
+        """
+        start, magic = self._start, self._magic
+        cases = self.cases
+        reads = [(case.response[2:-1], case.command.device_type) for case in cases if case.rw == MOZA_COMMAND_READ]
+        decoder = self._decoder
+        commands, ids_to_names = self._commands, self._ids_to_names
+
+        def encode():
+            for case in cases:
+                case.command.set_payload(case.value)
+                case.command.prepare_message(start, case.rw, magic)
+
+        def encode_legacy():
+            for case in cases:
+                case.legacy.set_payload(case.value)
+                case.legacy.prepare_message(start, case.rw, magic)
+
+        def decode():
+            for body, device_name in reads:
+                decoder.decode(body, device_name)
+
+        def decode_reference():
+            for body, device_name in reads:
+                MozaCommand.value_from_response(body, device_name, commands, ids_to_names)
+
+        # Every response of a port as one stream, split like serial reads
+        streams: dict[str, list[bytes]] = {}
+        for case in cases:
+            streams.setdefault(case.command.device_type, []).append(case.response)
+
+        chunks = []
+        for device_name, responses in streams.items():
+            stream = b"".join(responses)
+            for i in range(0, len(stream), BENCH_CHUNK_SIZE):
+                chunks.append((device_name, stream[i:i + BENCH_CHUNK_SIZE]))
+
+        dispatcher = EventDispatcher()
+        received = [0]
+        def on_value(value):
+            received[0] += 1
+
+        for device_name, commands_data in self._commands.items():
+            for name in commands_data:
+                dispatcher._register_event(f"{device_name}-{name}")
+                dispatcher.subscribe(f"{device_name}-{name}", on_value)
+        dispatcher._register_event("hpattern-output-y")
+        dispatcher.subscribe("hpattern-output-y", on_value)
+
+        parsers = {device_name: MozaFrameParser(start, magic) for device_name in streams}
+
+        def dispatch():
+            for device_name, chunk in chunks:
+                parser = parsers[device_name]
+                parser.feed(chunk)
+                for frame in parser.frames():
+                    entry, event, value = decoder.decode_entry(frame, device_name)
+                    if event is None:
+                        decoder.decode_ack(frame, device_name)
+                        continue
+                    dispatcher._dispatch(event, value)
+
+        return {
+            "encode"           : self._measure(encode, len(cases), min_time, rounds),
+            "encode-legacy"    : self._measure(encode_legacy, len(cases), min_time, rounds),
+            "decode"           : self._measure(decode, len(reads), min_time, rounds),
+            "decode-reference" : self._measure(decode_reference, len(reads), min_time, rounds),
+            "dispatch"         : self._measure(dispatch, len(cases), min_time, rounds),
+        }
+
+
+
+def load_baseline(baseline_path: str) -> dict:
+    try:
+        with open(os.path.expanduser(baseline_path)) as stream:
+            return yaml.safe_load(stream) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
+
+
+def save_baseline(baseline_path: str, results: dict, cases: int) -> None:
+    baseline_path = os.path.expanduser(baseline_path)
+    directory = os.path.dirname(baseline_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    with open(baseline_path, "w") as stream:
+        yaml.safe_dump({"cases": cases, "frames-per-second": {
+            name: round(value) for name, value in results.items()}}, stream)
+
+
+def compare(results: dict, baseline: dict, tolerance=BENCH_TOLERANCE) -> list[str]:
+    """
+    Print results next to the baseline, returns metrics that got slower than allowed
+    """
+    regressions = []
+    reference = baseline.get("frames-per-second", {})
+
+    for name, value in results.items():
+        line = f"{name:>17}: {value:12,.0f} frames/s"
+        old = reference.get(name)
+        if old:
+            change = value / old - 1
+            line += f"  baseline {old:12,.0f} ({change:+.1%})"
+            if change < -tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    return regressions
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("boxflat.codec_benchmark")
+    parser.add_argument("--data-path", help="Boxflat data path", type=str, default="data")
+    parser.add_argument("--baseline", help="Baseline file", type=str, default=BENCH_BASELINE)
+    parser.add_argument("--save-baseline", help="Store these results as the new baseline", action="store_true")
+    parser.add_argument("--tolerance", help="Allowed slowdown against the baseline", type=float, default=BENCH_TOLERANCE)
+    parser.add_argument("--min-time", help="Seconds per measurement round", type=float, default=BENCH_MIN_TIME)
+    parser.add_argument("--check-only", help="Skip the benchmark", action="store_true")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.data_path, "serial.yml")) as stream:
+        serial_data = yaml.safe_load(stream)
+
+    bench = CodecBenchmark(serial_data)
+    passed = bench.check()
+    for failure in bench.failures:
+        print(f"FAIL {failure}")
+    print(f"{len(bench.cases)} cases, {len(bench.failures)} failed, {bench.aliases} shadowed by another command, "
+        f"{bench.unsolicited} sent unsolicited")
+
+    baseline = load_baseline(args.baseline)
+    if baseline.get("cases") and baseline["cases"] != len(bench.cases):
+        print(f"Baseline was taken with {baseline['cases']} cases")
+
+    regressions = []
+    if not args.check_only:
+        results = bench.benchmark(args.min_time)
+        regressions = compare(results, baseline, args.tolerance)
+
+        if args.save_baseline:
+            save_baseline(args.baseline, results, len(bench.cases))
+            print(f"Baseline saved to {args.baseline}")
+
+    exit(0 if passed and not regressions else 1)
@@ -0,0 +1,135 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import yaml
+import marshal
+import hashlib
+from os import path, makedirs, replace
+
+DB_CACHE_FILE = "serial-cache.bin"
+DB_CACHE_FORMAT = 1
+
+# libyaml is a lot faster, but it's optional
+DB_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class CommandDatabase():
+    """
+    serial.yml compiled into flat tables indexed by integer command handles.
+    Resolving a command name is a single dict lookup.
+
+    The compiled tables are cached keyed by the hash of serial.yml,
+    so the YAML is only parsed again after it changed.
+    """
+    def __init__(self, serial_data: dict, tables: dict=None):
+        self.serial_data = serial_data
+        if tables is None:
+            tables = self._compile(serial_data)
+
+        # Event names ("device-command") by handle
+        self.names: list[str] = tables["names"]
+        self.devices: list[str] = tables["devices"]
+        self.commands: list[str] = tables["commands"]
+        self.polling_list: list[str] = tables["polling"]
+
+        self.handles: dict[str, int] = {name: handle for handle, name in enumerate(self.names)}
+        self.readable: set[str] = set(self.polling_list)
+
+
+    @staticmethod
+    def _compile(serial_data: dict) -> dict:
+        tables = {"names": [], "devices": [], "commands": [], "polling": []}
+        device_ids = serial_data["device-ids"]
+
+        for device, commands in serial_data["commands"].items():
+            if device_ids[device] == -1:
+                continue
+
+            for command, data in commands.items():
+                event_name = f"{device}-{command}"
+                tables["names"].append(event_name)
+                tables["devices"].append(device)
+                tables["commands"].append(command)
+
+                if data["read"] != -1:
+                    tables["polling"].append(event_name)
+
+        return tables
+
+
+    def split(self, event_name: str) -> tuple[str, str]:
+        """
+        Command and device name, empty strings if the command doesn't exist
+        """
+        handle = self.handles.get(event_name)
+        if handle is None:
+            return "", ""
+        return self.commands[handle], self.devices[handle]
+
+
+    def __contains__(self, event_name: str) -> bool:
+        return event_name in self.handles
+
+
+    @staticmethod
+    def load(serial_data_path: str, cache_path: str=None) -> "CommandDatabase":
+        """
+        Load from the cache in cache_path if it matches serial.yml,
+        parse and refresh the cache otherwise
+        """
+        with open(serial_data_path, "rb") as stream:
+            raw = stream.read()
+
+        key = f"{DB_CACHE_FORMAT}-{marshal.version}-{hashlib.sha256(raw).hexdigest()}"
+        cache_file = None
+        if cache_path is not None:
+            cache_file = path.join(path.expanduser(cache_path), DB_CACHE_FILE)
+
+            cached = CommandDatabase._read_cache(cache_file, key)
+            if cached is not None:
+                return CommandDatabase(cached["serial-data"], cached["tables"])
+
+        serial_data = yaml.load(raw, Loader=DB_YAML_LOADER)
+        database = CommandDatabase(serial_data)
+
+        if cache_file is not None:
+            database._write_cache(cache_file, key)
+
+        return database
+
+
+    @staticmethod
+    def _read_cache(cache_file: str, key: str) -> dict:
+        try:
+            with open(cache_file, "rb") as stream:
+                cached = marshal.loads(stream.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if not isinstance(cached, dict) or cached.get("key") != key:
+            return None
+        return cached
+
+
+    def _write_cache(self, cache_file: str, key: str) -> None:
+        cached = {
+            "key"         : key,
+            "serial-data" : self.serial_data,
+            "tables"      : {
+                "names"    : self.names,
+                "devices"  : self.devices,
+                "commands" : self.commands,
+                "polling"  : self.polling_list,
+            }
+        }
+
+        try:
+            directory = path.dirname(cache_file)
+            if not path.exists(directory):
+                makedirs(directory)
+
+            with open(cache_file + ".tmp", "wb") as stream:
+                marshal.dump(cached, stream)
+            replace(cache_file + ".tmp", cache_file)
+
+        except (OSError, ValueError) as error:
+            print(f"Can't cache the command database: {error}")
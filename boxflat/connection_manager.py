@@ -7,12 +7,48 @@ from serial import Serial
 from threading import Thread, Lock, Event
 import time
 from .hid_handler import MozaHidDevice
-from .subscription import SubscriptionList, EventDispatcher, BlockingValue
+from .subscription import SubscriptionList, EventDispatcher, PendingRequests
 from queue import SimpleQueue
-from .serial_handler import SerialHandler
+from .serial_handler import SerialHandler, SerialEventLoop
+from .serial_handler import WRITE_LANE_SAFETY, WRITE_LANE_TELEMETRY, WRITE_LANE_INTERACTIVE, WRITE_LANE_BULK
+from .shadow_registers import ShadowRegisters
+from .routing import RoutingTable
+from .hotplug import SerialHotplugMonitor
+from .polling import PollingScheduler, poll_settings
+from .capabilities import CapabilityMap
+from .fingerprints import DeviceFingerprints, DeviceFingerprint
+from .serial_recorder import SerialRecorder
+from .serial_stats import RoundTripStats, dump_stats
+from .command_database import CommandDatabase
+from .sessions import SessionGate, DeviceSession
+from .timeouts import AdaptiveTimeouts, RTO_CONCLUSIVE
+from contextlib import contextmanager
+from . import tracing
+from collections import deque
 import re
 
 CM_RETRY_COUNT=1
+CM_CHAIN_LENGTH=16
+
+# Everything a session sends shares one lane, so it goes out in order
+CM_SESSION_LANE=WRITE_LANE_INTERACTIVE
+CM_WRITE_RATE=30
+CM_COALESCED_TYPES=("int", "float")
+CM_SHADOW_MAX_AGE=10
+CM_POLLING_GAP=0.002
+CM_POLLING_IDLE=1
+CM_SHUTDOWN_TIMEOUT=1
+
+CM_SAFETY_COMMANDS=(
+    "base-ffb-disable",
+)
+
+CM_TELEMETRY_COMMANDS=(
+    "wheel-send-rpm-telemetry",
+    "wheel-send-buttons-telemetry",
+    "wheel-old-send-telemetry",
+    "dash-send-telemetry",
+)
 
 HidDeviceMapping = {
     "base"       : MozaHidDevice.BASE,
@@ -36,6 +72,9 @@ SerialDeviceMapping = {
     "moza_.*_digital_dash"   : "dash",
 }
 
+SerialDevicePatterns = [(re.compile(part.replace(" ", "_")), name)
+    for part, name in SerialDeviceMapping.items()]
+
 
 class MozaSerialDevice():
     name: str
@@ -50,7 +89,7 @@ class MozaSerialDevice():
 
 
 class MozaConnectionManager(EventDispatcher):
-    def __init__(self, serial_data_path: str, dry_run=False):
+    def __init__(self, serial_data_path: str, dry_run=False, serial_path="/dev/serial/by-id", cache_path: str=None):
         super().__init__()
 
         self._serial_data = None
@@ -62,35 +101,52 @@ class MozaConnectionManager(EventDispatcher):
 
         self._serial_devices: dict[str, MozaSerialDevice] = {}
         self._devices_lock = Lock()
-        self._exclusive_access = Event()
-        self._exclusive_access.set()
-
-        with open(serial_data_path) as stream:
-            try:
-                self._serial_data = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-                self._shutdown.set()
-                quit(1)
+        self._pending_reads = PendingRequests()
+        self._pending_writes = PendingRequests()
+        self._write_intervals: dict[str, float] = {}
+        self._write_lanes: dict[str, int] = {}
+        self._write_lanes.update(dict.fromkeys(CM_SAFETY_COMMANDS, WRITE_LANE_SAFETY))
+        self._write_lanes.update(dict.fromkeys(CM_TELEMETRY_COMMANDS, WRITE_LANE_TELEMETRY))
+        self._shadow = ShadowRegisters()
+        self._routes = RoutingTable()
+        self._capabilities = CapabilityMap()
+        self._timeouts = AdaptiveTimeouts()
+        self._fingerprints = None
+        self._recorder = None
+
+        try:
+            self._database = CommandDatabase.load(serial_data_path, cache_path)
+        except yaml.YAMLError as exc:
+            print(exc)
+            self._shutdown.set()
+            quit(1)
+
+        self._serial_data = self._database.serial_data
 
         self._device_ids: dict[str, int] = self._serial_data["device-ids"]
+        self._session_gates = {device: SessionGate() for device in self._device_ids}
+        self._decoder = MozaResponseDecoder(
+            self._serial_data["commands"],
+            self._serial_data["ids-to-names"])
+        self._templates = MozaCommandTemplates(
+            self._serial_data["commands"],
+            int(self._serial_data["message-start"]),
+            int(self._serial_data["magic-value"]))
 
         # register events
-        self._command_list: list[str] = []
-        self._polling_list: list[str] = []
-        for device in self._serial_data["commands"]:
-            if self._device_ids[device] == -1:
-                continue
-
-            for command, data in self._serial_data["commands"][device].items():
-                event_name = f"{device}-{command}"
-                self._command_list.append(event_name)
-
-                if data["read"] == -1:
-                    continue
-
-                self._polling_list.append(event_name)
-
+        self._polling_list: list[str] = self._database.polling_list
+        self._poll_scheduler = PollingScheduler()
+        self._polling_scopes: dict[str, set[str]] = {}
+        self._polling_scope = None
+        self._visible_scope = None
+        self._window_visible = True
+        self._pinned_commands: set[str] = set()
+        for event_name in self._polling_list:
+            command, device = self._database.split(event_name)
+            data = self._serial_data["commands"][device][command]
+            self._poll_scheduler.add(event_name, *poll_settings(event_name, data))
+
+        self._rtt_stats = RoundTripStats(self._polling_list)
         self._register_events(*self._polling_list)
         self._register_events("device-connected", "hid-device-connected")
         self._register_events("device-disconnected", "hid-device-disconnected")
@@ -104,16 +160,36 @@ class MozaConnectionManager(EventDispatcher):
 
         self._message_start= int(self._serial_data["message-start"])
         self._magic_value = int(self._serial_data["magic-value"])
-        self._serial_path = "/dev/serial/by-id"
-        # self._serial_path = "/dev/pts"
+        self._serial_path = serial_path
+        self._discovery_lock = Lock()
+        self._hotplug = SerialHotplugMonitor(self._serial_path, self.device_discovery)
 
 
     def shutdown(self, *rest):
         self._dispatch("shutdown")
         self._shutdown.set()
+        self._hotplug.stop()
+
+        with self._discovery_lock:
+            with self._devices_lock:
+                devices = self._serial_devices
+                self._serial_devices = {}
+
+        for device in devices.values():
+            device.serial_handler.stop()
+        SerialEventLoop.instance().sync(CM_SHUTDOWN_TIMEOUT)
+
+        self.save_fingerprints()
+        self.stop_recording()
 
 
     def device_discovery(self, *args):
+        with self._discovery_lock:
+            if not self._shutdown.is_set():
+                self._device_discovery()
+
+
+    def _device_discovery(self):
         # print("\nDevice discovery...")
         if not os.path.exists(self._serial_path):
             # print("No devices found!")
@@ -127,9 +203,9 @@ class MozaConnectionManager(EventDispatcher):
 
         serial_devices: dict[str, MozaSerialDevice] = {}
         for path in devices:
-            for part, name in SerialDeviceMapping.items():
-                part = part.replace(" ", "_")
-                if not re.search(part, path.lower()):
+            lower_path = path.lower()
+            for pattern, name in SerialDevicePatterns:
+                if not pattern.search(lower_path):
                     continue
 
                 serial_devices[name] = MozaSerialDevice(name, path)
@@ -151,9 +227,11 @@ class MozaConnectionManager(EventDispatcher):
 
             new_devices[name].serial_handler = SerialHandler(
                 new_devices[name].path,
-                self._message_start, name)
+                self._message_start, name, self._magic_value)
 
             new_devices[name].serial_handler.subscribe(self._receive_data, name)
+            new_devices[name].serial_handler.set_recorder(self._recorder)
+            self._reset_capabilities(name)
             self._dispatch("device-connected", name)
             if name in HidDeviceMapping:
                 self._dispatch("hid-device-connected", HidDeviceMapping[name])
@@ -163,6 +241,10 @@ class MozaConnectionManager(EventDispatcher):
                 continue
 
             device.serial_handler.stop()
+            self._routes.forget_port(name)
+            self._timeouts.forget_port(name)
+            self._reset_capabilities(name)
+            self._invalidate_shadow(name, new_devices)
             self._dispatch("device-disconnected", name)
             if name in HidDeviceMapping:
                 self._dispatch("hid-device-disconnected", HidDeviceMapping[name])
@@ -193,33 +275,175 @@ class MozaConnectionManager(EventDispatcher):
 
 
     def _polling_thread(self):
+        scheduler = self._poll_scheduler
+        scheduler.reset()
+        in_flight = deque()
+
         while self._refresh_cont.is_set():
-            time.sleep(2)
+            self._expire_polls(in_flight)
+            command, delay = scheduler.pop()
+            if command is None:
+                time.sleep(CM_POLLING_IDLE if delay is None else min(delay, CM_POLLING_IDLE))
+                continue
 
-            for command in self._polling_list:
-                if command.startswith("estop-receive"):
-                    continue
+            if not self._polling_demand(command) or self._capabilities.should_skip(command):
+                scheduler.done(command, polled=False)
+                continue
+
+            # Don't interleave with a session, other devices keep being polled
+            if self._session_busy(command):
+                scheduler.done(command, polled=False)
+                continue
+
+            # Someone else refreshed it in the meantime. Anything within
+            # a read timeout of our last poll is just the answer to it
+            register = self._shadow.get(command, scheduler.get_interval(command))
+            answered_by = scheduler.last_polled(command) + self._command_timeout(command)
+            if register is not None and register.timestamp > answered_by:
+                scheduler.done(command, polled=False, last_update=register.timestamp)
+                continue
+
+            # print("Polling data: " + command)
+            timeout = self._command_timeout(command)
+            future = self._get_setting(command, timeout)
+            if future is not None:
+                in_flight.append((time.monotonic() + timeout, timeout, command, future))
+
+            scheduler.done(command)
+            time.sleep(CM_POLLING_GAP)
+
+
+    def _expire_polls(self, in_flight: deque) -> None:
+        """
+        Nobody waits on polled reads, so timeouts are collected afterwards
+        """
+        now = time.monotonic()
+        while in_flight and in_flight[0][0] <= now:
+            _, timeout, command_name, future = in_flight.popleft()
+            if not future.done():
+                self._pending_reads.cancel(future)
+                self._read_timeout(command_name, timeout)
+
+
+    def _read_timeout(self, command_name: str, timeout: float) -> None:
+        # A command that never answered says nothing about the route
+        supported = self._capabilities.is_supported(command_name)
+        device_type = command_name.split("-", maxsplit=1)[0]
+        if supported:
+            with self._devices_lock:
+                ports = self._routes.resolve(device_type, self._serial_devices)
+            self._timeouts.backoff(device_type, ports)
+
+        self._rtt_stats.record_timeout(command_name)
+        if timeout < RTO_CONCLUSIVE:
+            return
+
+        if supported:
+            self._routes.miss(device_type)
+        self._capabilities.record_timeout(command_name)
+
+
+    def _adaptive_timeout(self, device_type: str) -> float:
+        """
+        Read timeout derived from round trips measured on the route to device_type
+        """
+        with self._devices_lock:
+            ports = self._routes.resolve(device_type, self._serial_devices)
+        return self._timeouts.timeout(device_type, ports)
+
+
+    def _command_timeout(self, command_name: str) -> float:
+        """
+        Commands that never answered get the full wait,
+        their misses decide if they're supported at all
+        """
+        timeout = self._adaptive_timeout(command_name.split("-", maxsplit=1)[0])
+        if not self._capabilities.is_supported(command_name):
+            timeout = max(timeout, RTO_CONCLUSIVE)
+        return timeout
+
+
+    def _polling_demand(self, command_name: str) -> bool:
+        """
+        Only poll what is on screen, pinned commands are always polled
+        """
+        if self._event_sub_count(command_name) <= 0:
+            return False
+
+        if command_name in self._pinned_commands:
+            return True
+
+        if not self._window_visible:
+            return False
+
+        scopes = self._polling_scopes.get(command_name)
+        return scopes is None or None in scopes or self._visible_scope in scopes
+
+
+    def subscribe(self, event_name: str, callback, *args):
+        self._polling_scopes.setdefault(event_name, set()).add(self._polling_scope)
+        return super().subscribe(event_name, callback, *args)
+
+
+    def set_polling_scope(self, scope: str) -> None:
+        """
+        Subscriptions made from now on belong to this scope (panel page).
+        None for subscriptions that should be polled whenever the window is shown.
+        """
+        self._polling_scope = scope
+
+
+    def set_visible_scope(self, scope: str) -> None:
+        if scope == self._visible_scope:
+            return
+
+        self._visible_scope = scope
+        self._poll_scheduler.expedite(
+            [name for name, scopes in self._polling_scopes.items() if scope in scopes])
+
+
+    def set_window_visible(self, visible: bool) -> None:
+        if visible == self._window_visible:
+            return
+
+        self._window_visible = visible
+        if visible:
+            self._poll_scheduler.expedite(
+                [name for name in self._polling_list if self._polling_demand(name)])
 
-                if self._event_sub_count(command) == 0:
-                    continue
 
-                # print("Polling data: " + command)
-                self._get_setting(command)
-                time.sleep(0.002)
+    def pin_polling(self, command_name: str, pinned=True) -> None:
+        """
+        Keep polling a command even if it's not on screen
+        """
+        if pinned:
+            self._pinned_commands.add(command_name)
+        else:
+            self._pinned_commands.discard(command_name)
 
 
     def _device_polling(self):
         time.sleep(1)
+
+        # Serial devices are picked up on hotplug events, polling is just a fallback
+        hotplug = self._hotplug.start()
+        self.device_discovery()
+
         while not self._shutdown.is_set():
-            self.device_discovery()
+            if not hotplug:
+                self.device_discovery()
+
+            if not self._window_visible:
+                time.sleep(3)
+                continue
 
             with self._connected_lock:
                 lists = self._connected_subscriptions.copy()
 
+            # Probes go out even for known absent devices, only without the retry
+            values = self.get_settings(list(lists.keys()), retries=1, skip_unsupported=False)
             for command, subs in lists.items():
-                value = self.get_setting(command)
-                if value is None:
-                    value = self.get_setting(command)
+                value = values[command]
                 if value is None:
                     value = -1
                 subs.call(value)
@@ -248,54 +472,220 @@ class MozaConnectionManager(EventDispatcher):
         return id
 
 
-    def _get_device_handler(self, device_type: str) -> SerialHandler:
-        device_handler = None
+    def _receive_data(self, data: bytes, device_name: str):
+        start = tracing.now()
+        entry, command, value = self._decoder.decode_entry(data, device_name)
+
+        if value is None or command is None:
+            entry = self._decoder.decode_ack(data, device_name)
+            if entry is None:
+                return
+
+            self._routes.learn(entry.key[0], device_name)
+            self._capabilities.record_response(entry.event)
+            self._shadow.update(entry.event, entry.decode(data[2:]), data[2 + len(entry.key[2]):])
+            self._pending_writes.resolve(entry.key, True)
+            tracing.span("receive-ack", start, tracing.flow_take(entry.key), flow_in=True, command=entry.event)
+            return
+
+        self._routes.learn(entry.key[0], device_name)
+        self._capabilities.record_response(command)
+        self._shadow.update(command, value, data[2 + len(entry.key[2]):])
+
+        rtt = self._pending_reads.resolve(entry.key, value)
+        if rtt is not None:
+            self._rtt_stats.record_rtt(entry.event, rtt)
+            self._timeouts.sample(entry.key[0], device_name, rtt)
+
+        # Widgets updated by this value continue the flow
+        flow = tracing.flow_take(entry.key)
+        tracing.set_current(flow)
+        dispatch = tracing.now()
+
+        # print(f"{command} received: {data.hex(":")}")
+        self._dispatch(command, value)
+
+        tracing.span("dispatch", dispatch, command=command)
+        tracing.set_current(None)
+        tracing.span("receive", start, flow, flow_in=True, flow_out=True, command=command)
+
+
+    def _invalidate_shadow(self, device_name: str, connected_devices: dict) -> None:
+        self._shadow.invalidate_device(device_name)
+        if device_name not in ("base", "hub"):
+            return
+
+        # Everything that was reached through the base/hub is gone as well
+        self._shadow.invalidate_device("main")
+        for device in self._device_ids:
+            if device not in connected_devices:
+                self._shadow.invalidate_device(device)
+
+
+    def start_recording(self, log_path: str) -> None:
+        """
+        Log raw serial traffic of every device, see boxflat.serial_recorder
+        """
+        self.stop_recording()
+        self._recorder = SerialRecorder(log_path)
+
+        with self._devices_lock:
+            for device in self._serial_devices.values():
+                device.serial_handler.set_recorder(self._recorder)
+
+
+    def stop_recording(self) -> None:
+        if self._recorder is None:
+            return
+
         with self._devices_lock:
-            if device_type in self._serial_devices:
-                device_handler = self._serial_devices[device_type].serial_handler
+            for device in self._serial_devices.values():
+                device.serial_handler.set_recorder(None)
+
+        self._recorder.close()
+        self._recorder = None
 
-            elif "base" in self._serial_devices:
-                # print(f"Redirect {device_type} to base")
-                device_handler = self._serial_devices["base"].serial_handler
 
-        return device_handler
+    def load_fingerprints(self, config_path: str) -> None:
+        self._fingerprints = DeviceFingerprints(config_path)
 
 
-    def _get_hub_handler(self) -> SerialHandler:
-        if "hub" not in self._serial_devices:
+    def restore_fingerprints(self) -> None:
+        """
+        Show devices and values from the last session right away.
+        Polling validates and corrects them in the background.
+        """
+        if self._fingerprints is None:
             return
-        # print(f"Redirect {device_type} to hub")
-        return self._serial_devices["hub"].serial_handler
 
+        fingerprints, wheel_id = self._fingerprints.load()
+        if not fingerprints:
+            return
 
-    def _receive_data(self, data: bytes, device_name: str):
-        command, value = MozaCommand.value_from_response(
-            data, device_name,
-            self._serial_data["commands"],
-            self._serial_data["ids-to-names"])
+        if wheel_id is not None and "wheel" in fingerprints:
+            self._serial_data["device-ids"]["wheel"] = int(wheel_id)
 
-        if value is None or command is None:
+        with self._connected_lock:
+            lists = self._connected_subscriptions.copy()
+
+        for command, subs in lists.items():
+            fingerprint = fingerprints.get(command.split("-", maxsplit=1)[0])
+            if fingerprint is None or command not in fingerprint.commands:
+                continue
+
+            if command in fingerprint.registers:
+                subs.call(fingerprint.registers[command])
+
+        for fingerprint in fingerprints.values():
+            for command, value in fingerprint.registers.items():
+                if command in self._database.readable:
+                    self._dispatch(command, value)
+
+
+    def save_fingerprints(self) -> None:
+        if self._fingerprints is None:
             return
 
-        # print(f"{command} received: {data.hex(":")}")
-        self._dispatch(command, value)
+        with self._devices_lock:
+            devices = self._serial_devices.copy()
+        routes = self._routes.routes()
+
+        fingerprints = {}
+        for device_name, commands in self._capabilities.snapshot().items():
+            port = device_name if device_name in devices else routes.get(device_name)
+            if port not in devices:
+                continue
+
+            answered = [command for command, supported in commands.items() if supported]
+            if not answered:
+                continue
+
+            fingerprints[device_name] = DeviceFingerprint(
+                devices[port].path, answered, self._shadow.values(device_name))
+
+        self._fingerprints.save(fingerprints, self._serial_data["device-ids"]["wheel"])
+
 
+    def _reset_capabilities(self, device_name: str) -> None:
+        self._capabilities.reset_device(device_name)
 
-    def _handle_command_v2(self, command_data: MozaCommand, rw: int) -> bytes:
+        # Whatever was reached through them might be different now
+        if device_name in ("base", "hub"):
+            self._capabilities.clear()
+
+
+    def _get_command_handlers(self, device_type: str) -> list[SerialHandler]:
+        """
+        Serial devices a frame for device_type has to go out on.
+        Usually just one, every forwarding port while the route is unknown.
+        """
+        with self._devices_lock:
+            ports = self._routes.resolve(device_type, self._serial_devices)
+            return [self._serial_devices[port].serial_handler for port in ports]
+
+
+    def _handle_command_v2(self, command_data: MozaCommand, rw: int, coalesce=False, lane=WRITE_LANE_INTERACTIVE) -> bytes:
+        start = tracing.now()
         message = command_data.prepare_message(self._message_start, rw, self._magic_value)
-        device_handler = self._get_device_handler(command_data.device_type)
+        keys = ()
+        if rw == MOZA_COMMAND_WRITE:
+            keys = (command_data.ack_key,)
+
+        flow = tracing.flow_start(command_data.ack_key if keys else command_data.response_key)
+        tracing.span("encode", start, flow, flow_in=True, flow_out=True, command=command_data.name)
 
-        if device_handler is not None:
-            device_handler.write_bytes(message)
+        for device_handler in self._get_command_handlers(command_data.device_type):
+            tracing.bind(message, (flow,), device_handler)
+            if coalesce:
+                interval = self._write_intervals.get(
+                    f"{command_data.device_type}-{command_data.name}", 1 / CM_WRITE_RATE)
+                device_handler.write_coalesced(command_data.ack_key, message, interval)
+            else:
+                device_handler.write_bytes(message, keys, lane)
 
-        device_handler = self._get_hub_handler()
-        if device_handler is not None:
-            device_handler.write_bytes(message)
 
+    def _discard_coalesced(self, command_data: MozaCommand) -> None:
+        for device_handler in self._get_command_handlers(command_data.device_type):
+            device_handler.discard_coalesced((command_data.ack_key,))
 
-    def _handle_setting(self, value, command_name: str, device_name: str, rw: int) -> bool:
-        command = MozaCommand()
-        command.set_data_from_name(command_name, self._serial_data["commands"], device_name)
+
+    def _handle_commands(self, commands: list[MozaCommand], rw: int, lane=WRITE_LANE_BULK) -> None:
+        """
+        Chain multiple commands into a single write per serial device
+        """
+        chains: dict[SerialHandler, bytearray] = {}
+        flows: dict[SerialHandler, list[int]] = {}
+        keys = []
+        for command in commands:
+            start = tracing.now()
+            message = command.prepare_message(self._message_start, rw, self._magic_value)
+            if rw == MOZA_COMMAND_WRITE:
+                keys.append(command.ack_key)
+
+            flow = tracing.flow_start(command.ack_key if rw == MOZA_COMMAND_WRITE else command.response_key)
+            tracing.span("encode", start, flow, flow_in=True, flow_out=True, command=command.name)
+
+            for device_handler in self._get_command_handlers(command.device_type):
+                chains.setdefault(device_handler, bytearray()).extend(message)
+                flows.setdefault(device_handler, []).append(flow)
+
+        for device_handler, chain in chains.items():
+            chain = bytes(chain)
+            tracing.bind(chain, flows[device_handler], device_handler)
+            device_handler.write_bytes(chain, keys, lane)
+
+
+    def _handle_setting(self, value, command_name: str, device_name: str, rw: int, lane=WRITE_LANE_INTERACTIVE) -> bool:
+        command = self._prepare_command(value, command_name, device_name, rw)
+        if command is None:
+            return False
+
+        self._handle_command_v2(command, rw, lane=lane)
+        return True
+
+
+    def _prepare_command(self, value, command_name: str, device_name: str, rw: int) -> MozaCommand:
+        command = self._templates.command(device_name, command_name)
         command.device_id = self.get_device_id(command.device_type)
 
         if command.device_id == -1:
@@ -311,64 +701,276 @@ class MozaConnectionManager(EventDispatcher):
             return
 
         command.set_payload(value)
-        self._handle_command_v2(command, rw)
+        return command
 
 
     def _split_name(self, command_name: str) -> tuple[str, str]:
-        if command_name not in self._command_list:
+        name, device_name = self._database.split(command_name)
+        if name == "":
             print(f"Command not found: {command_name}")
-            return "", ""
+        return name, device_name
 
-        device_name = command_name.split("-", maxsplit=1)[0]
-        command_name = command_name.split("-", maxsplit=1)[1]
-        return command_name, device_name
 
+    @contextmanager
+    def session(self, device_name: str):
+        """
+        Exclusive, ordered access to one device:
 
-    def set_setting(self, value, command_name: str, exclusive=False):
-        self._exclusive_access.wait()
-        if exclusive:
-            self._exclusive_access.clear()
-            time.sleep(0.005)
+        with cm.session("dash") as dash:
+            mode = dash.get_setting("dash-rpm-indicator-mode")
+            dash.set_setting(1, "dash-rpm-indicator-mode")
+
+        Everything the session's thread sends to the device goes out in order
+        and uncoalesced, other threads wait for it and polling skips the device.
+        Safety frames and subscribers of device responses never wait.
+        Other devices aren't affected.
+        """
+        gate = self._session_gates[device_name]
+        gate.acquire()
+        try:
+            yield DeviceSession(self, device_name)
+        finally:
+            gate.release()
 
+
+    def _enter_session(self, device_name: str, exclusive: bool, lane=WRITE_LANE_INTERACTIVE) -> bool:
+        """
+        Wait for other threads' sessions on the device.
+        Returns True if the call has to be ordered (and holds the gate then)
+
+        Safety frames and subscribers never wait, a subscriber blocking
+        the notification thread would stall responses of every device
+        """
+        gate = self._session_gates.get(device_name)
+        if gate is None or lane == WRITE_LANE_SAFETY or SerialEventLoop.in_notification_thread():
+            return False
+
+        if exclusive or gate.owned():
+            gate.acquire()
+            return True
+
+        gate.wait()
+        return False
+
+
+    def _wait_session(self, device_name: str) -> bool:
+        """
+        Wait for other threads' sessions on the device without taking part in them.
+        Returns True if this thread holds the session itself.
+        """
+        gate = self._session_gates.get(device_name)
+        if gate is None or SerialEventLoop.in_notification_thread():
+            return False
+
+        gate.wait()
+        return gate.owned()
+
+
+    def _session_busy(self, command_name: str) -> bool:
+        gate = self._session_gates.get(command_name.split("-", maxsplit=1)[0])
+        return gate is not None and gate.busy()
+
+
+    def _leave_session(self, device_name: str) -> None:
+        self._session_gates[device_name].release()
+
+
+    def set_setting(self, value, command_name: str, exclusive=False):
+        start = tracing.now()
         name, device = self._split_name(command_name)
         if name == "":
             return
-        self._handle_setting(value, name, device, MOZA_COMMAND_WRITE)
 
-        if exclusive:
-            self._exclusive_access.set()
+        lane = self._write_lanes.get(command_name, WRITE_LANE_INTERACTIVE)
+        exclusive = self._enter_session(device, exclusive, lane)
+        try:
+            command = self._prepare_command(value, name, device, MOZA_COMMAND_WRITE)
+            if command is not None:
+                # Interactive writes of plain values only need to deliver the newest one.
+                # Safety and telemetry frames go out as-is on their own lanes,
+                # while everything in a session shares one lane to keep its order
+                if exclusive:
+                    lane = CM_SESSION_LANE
+
+                coalesce = (not exclusive
+                    and lane == WRITE_LANE_INTERACTIVE
+                    and command.type in CM_COALESCED_TYPES)
+                self._handle_command_v2(command, MOZA_COMMAND_WRITE, coalesce, lane)
+        finally:
+            if exclusive:
+                self._leave_session(device)
+
+        tracing.span("set_setting", start, tracing.current(), flow_in=True, flow_out=True, command=command_name)
 
         # if self.get_setting(command_name) != value:
         #     self._handle_setting(value, name, device, MOZA_COMMAND_WRITE)
 
 
-    def get_setting(self, command_name: str, exclusive=False, custom_value=1):
-        self._exclusive_access.wait()
-        if exclusive:
-            self._exclusive_access.clear()
-            time.sleep(0.005)
+    def set_settings(self, settings: dict, wait=False, timeout: float=None, force=False) -> dict:
+        """
+        Write multiple settings as chained frames.
+        Values the device is known to hold already are skipped unless forced.
+        With wait=True, returns which writes were acknowledged.
+        Without a timeout, waits as long as the slowest device needs.
+        """
+        acks = {}
+        commands = []
+        futures = {}
+        lane = WRITE_LANE_BULK
+        for command_name, value in settings.items():
+            name, device = self._split_name(command_name)
+            if name == "":
+                continue
+
+            if self._wait_session(device):
+                lane = CM_SESSION_LANE
+            command = self._prepare_command(value, name, device, MOZA_COMMAND_WRITE)
+            if command is None:
+                continue
+
+            if not force and self._shadow.matches(command_name, command.payload, CM_SHADOW_MAX_AGE):
+                self._discard_coalesced(command)
+                acks[command_name] = True
+                continue
+
+            commands.append(command)
+            if wait:
+                futures[command_name] = self._pending_writes.add(command.ack_key)
+
+        for i in range(0, len(commands), CM_CHAIN_LENGTH):
+            self._handle_commands(commands[i:i + CM_CHAIN_LENGTH], MOZA_COMMAND_WRITE, lane)
+
+        if timeout is None:
+            timeout = max(map(self._command_timeout, futures), default=0)
+
+        deadline = time.monotonic() + timeout
+        for command_name, future in futures.items():
+            acks[command_name] = bool(future.result(max(0, deadline - time.monotonic())))
+            if not future.done():
+                self._pending_writes.cancel(future)
+
+        return acks
 
-        value = BlockingValue()
 
-        sub = self.subscribe_once(command_name, value.set_value)
-        self._get_setting(command_name, exclusive, custom_value)
-        response = value.get_value_no_clear()
+    def get_setting(self, command_name: str, exclusive=False, custom_value=1, timeout: float=None, max_age: float=None):
+        if max_age is not None:
+            cached = self._shadow.get_value(command_name, max_age)
+            if cached is not None:
+                return cached
 
-        if response is None:
-            self._remove_subscription(command_name, sub)
+        if self._capabilities.should_skip(command_name):
+            return None
 
-        if exclusive:
-            time.sleep(0.01)
-            self._exclusive_access.set()
+        name, device = self._split_name(command_name)
+        if name == "":
+            return None
+
+        response = None
+        exclusive = self._enter_session(device, exclusive)
+        try:
+            command = self._prepare_command(custom_value, name, device, MOZA_COMMAND_READ)
+            if command is not None:
+                if timeout is None:
+                    timeout = self._command_timeout(command_name)
+
+                future, send = self._pending_reads.request(command.response_key, timeout)
+                if send:
+                    self._handle_command_v2(command, MOZA_COMMAND_READ)
+                response = future.result(timeout)
+
+                if not future.done():
+                    self._pending_reads.cancel(future)
+                    self._read_timeout(command_name, timeout)
+        finally:
+            if exclusive:
+                self._leave_session(device)
 
         return response
 
 
-    def _get_setting(self, command_name: str, exclusive=False, custom_value=1):
+    def get_settings(self, command_names: list[str], timeout: float=None, retries=0, custom_value=1,
+                     skip_unsupported=True, max_age: float=None) -> dict:
+        """
+        Read multiple settings with pipelined requests.
+        Returns a dict of values, None for every command that didn't respond.
+        Commands known not to answer are skipped and never retried.
+        Without a timeout, every chain waits as long as its slowest device needs.
+        With max_age, values known for at most that long aren't read again.
+        """
+        values = dict.fromkeys(command_names)
+        if max_age is not None:
+            for command_name in command_names:
+                values[command_name] = self._shadow.get_value(command_name, max_age)
+
+        missing = [name for name, value in values.items() if value is None]
+        if skip_unsupported:
+            missing = [name for name in missing if not self._capabilities.should_skip(name)]
+
+        for _ in range(retries + 1):
+            for i in range(0, len(missing), CM_CHAIN_LENGTH):
+                values.update(self._get_settings_chain(missing[i:i + CM_CHAIN_LENGTH], timeout, custom_value))
+
+            missing = [name for name in missing
+                if values[name] is None and not self._capabilities.is_unsupported(name)]
+            if not missing:
+                break
+
+        return values
+
+
+    def _get_settings_chain(self, command_names: list[str], timeout: float, custom_value: int) -> dict:
+        commands = []
+        futures = {}
+        chain_timeout = 0
+        lane = WRITE_LANE_BULK
+        for command_name in command_names:
+            name, device = self._split_name(command_name)
+            if name == "":
+                continue
+
+            if self._wait_session(device):
+                lane = CM_SESSION_LANE
+            command = self._prepare_command(custom_value, name, device, MOZA_COMMAND_READ)
+            if command is None:
+                continue
+
+            command_timeout = timeout
+            if command_timeout is None:
+                command_timeout = self._command_timeout(command_name)
+            chain_timeout = max(chain_timeout, command_timeout)
+
+            future, send = self._pending_reads.request(command.response_key, command_timeout)
+            futures[command_name] = future
+            if send:
+                commands.append(command)
+
+        if commands:
+            self._handle_commands(commands, MOZA_COMMAND_READ, lane)
+
+        values = {}
+        deadline = time.monotonic() + chain_timeout
+        for command_name, future in futures.items():
+            values[command_name] = future.result(max(0, deadline - time.monotonic()))
+            if not future.done():
+                self._pending_reads.cancel(future)
+                self._read_timeout(command_name, chain_timeout)
+
+        return values
+
+
+    def _get_setting(self, command_name: str, timeout: float, custom_value=1):
         name, device = self._split_name(command_name)
         if name == "":
             return
-        self._handle_setting(custom_value, name, device, MOZA_COMMAND_READ)
+
+        command = self._prepare_command(custom_value, name, device, MOZA_COMMAND_READ)
+        if command is None:
+            return
+
+        future, send = self._pending_reads.request(command.response_key, timeout)
+        if send:
+            self._handle_command_v2(command, MOZA_COMMAND_READ, lane=WRITE_LANE_BULK)
+        return future
 
 
     def cycle_wheel_id(self, old=False) -> int:
@@ -390,10 +992,114 @@ class MozaConnectionManager(EventDispatcher):
                 wid = self._serial_data["device-ids"]["pedals"] - 2
 
             self._serial_data["device-ids"]["wheel"] = wid
+            self._shadow.invalidate_device("wheel")
 
             # print(f"Cycling wheel id. New id: {wid}")
             return wid
 
 
+    def set_polling_interval(self, command_name: str, interval: float, priority: int=None) -> None:
+        """
+        Refresh interval (seconds) of a polled command, 0 stops polling it
+        """
+        self._poll_scheduler.set_interval(command_name, interval, priority)
+
+
+    def get_poll_counts(self) -> dict[str, int]:
+        return self._poll_scheduler.poll_counts()
+
+
+    def set_write_rate(self, command_name: str, rate: float) -> None:
+        """
+        Max rate (Hz) at which coalesced writes of a command are flushed
+        """
+        self._write_intervals[command_name] = 1 / rate
+
+
+    def set_command_lane(self, command_name: str, lane: int) -> None:
+        """
+        Send writes of a command through a different priority lane
+        """
+        self._write_lanes[command_name] = lane
+
+
+    def write_queue_depth(self) -> dict[str, tuple[int, int]]:
+        """
+        Pending bytes and coalesced commands per serial device
+        """
+        with self._devices_lock:
+            devices = self._serial_devices.copy()
+
+        depth = {}
+        for name, device in devices.items():
+            handler = device.serial_handler
+            depth[name] = (handler.write_queue_depth, handler.coalesced_depth)
+        return depth
+
+
+    def get_capabilities(self) -> dict[str, dict[str, bool]]:
+        """
+        Commands every device answered (True) or is backed off for (False)
+        """
+        return self._capabilities.snapshot()
+
+
+    def read_dedup_stats(self) -> dict[str, int]:
+        """
+        Reads attached to an in-flight request (hits) vs. reads sent out (misses)
+        """
+        return {"hits": self._pending_reads.hits, "misses": self._pending_reads.misses}
+
+
+    def get_routes(self) -> dict[str, str]:
+        """
+        Learned serial port of every device without a direct connection
+        """
+        return self._routes.routes()
+
+
+    def get_read_timeouts(self) -> dict[str, dict]:
+        """
+        Smoothed round trip and read timeout of every device route
+        """
+        return self._timeouts.snapshot()
+
+
+    def write_lane_stats(self) -> dict[str, dict]:
+        with self._devices_lock:
+            devices = self._serial_devices.copy()
+
+        return {name: device.serial_handler.lane_stats() for name, device in devices.items()}
+
+
+    def get_serial_stats(self) -> dict[str, dict]:
+        """
+        Counters of every serial device, read round trips of every command
+        and read timeouts of every route
+        """
+        with self._devices_lock:
+            devices = self._serial_devices.copy()
+
+        ports = {}
+        for name, device in devices.items():
+            ports[name] = device.serial_handler.serial_stats()
+            ports[name]["lanes"] = device.serial_handler.lane_stats()
+
+        return {
+            "ports"    : ports,
+            "reads"    : self.read_dedup_stats(),
+            "commands" : self._rtt_stats.snapshot(),
+            "timeouts" : self._timeouts.snapshot(),
+        }
+
+
+    def reset_serial_stats(self) -> None:
+        self._rtt_stats.reset()
+
+
+    def dump_serial_stats(self, output_path: str=None) -> None:
+        dump_stats(self.get_serial_stats(), output_path)
+
+
     def get_command_data(self) -> dict[str, dict]:
         return self._serial_data["commands"]
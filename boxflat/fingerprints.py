@@ -0,0 +1,83 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import yaml
+from os import path, makedirs, replace
+from threading import Lock
+
+
+class DeviceFingerprint():
+    __slots__ = ("path", "commands", "registers")
+
+    def __init__(self, serial_path: str, commands: list[str], registers: dict):
+        self.path = serial_path
+        self.commands = set(commands)
+        self.registers = registers
+
+
+    def to_dict(self) -> dict:
+        return {
+            "path"      : self.path,
+            "commands"  : sorted(self.commands),
+            "registers" : self.registers,
+        }
+
+
+    @staticmethod
+    def from_dict(data: dict) -> "DeviceFingerprint":
+        return DeviceFingerprint(
+            data.get("path", ""),
+            data.get("commands", []),
+            data.get("registers", {}))
+
+
+
+class DeviceFingerprints():
+    """
+    What every device looked like when boxflat was closed:
+    serial path, commands it answered, last register values and the wheel id.
+    Only a hint for the next start, polling validates it afterwards.
+    """
+    def __init__(self, config_path: str):
+        self._config_path = path.expanduser(config_path)
+        self._file = path.join(self._config_path, "devices.yml")
+        self._lock = Lock()
+
+
+    def load(self) -> tuple[dict[str, DeviceFingerprint], int]:
+        """
+        Fingerprints of devices that are still plugged in, and the last wheel id
+        """
+        data = {}
+        with self._lock:
+            try:
+                with open(self._file, "r") as stream:
+                    data = yaml.safe_load(stream) or {}
+            except (OSError, yaml.YAMLError):
+                return {}, None
+
+        fingerprints = {}
+        for device_name, device in data.get("devices", {}).items():
+            fingerprint = DeviceFingerprint.from_dict(device)
+            if path.exists(fingerprint.path):
+                fingerprints[device_name] = fingerprint
+
+        return fingerprints, data.get("wheel-id")
+
+
+    def save(self, fingerprints: dict[str, DeviceFingerprint], wheel_id: int) -> None:
+        data = {
+            "wheel-id" : wheel_id,
+            "devices"  : {name: fingerprint.to_dict() for name, fingerprint in fingerprints.items()}
+        }
+
+        with self._lock:
+            try:
+                if not path.exists(self._config_path):
+                    makedirs(self._config_path)
+
+                with open(self._file + ".tmp", "w") as stream:
+                    yaml.safe_dump(data, stream)
+                replace(self._file + ".tmp", self._file)
+
+            except OSError as error:
+                print(f"Can't save device fingerprints: {error}")
@@ -0,0 +1,215 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+import selectors
+from threading import Thread, Event
+from .serial_handler import SerialEventLoop
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+IN_WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 4096
+
+# udev creates/removes the by-id links in bursts
+HOTPLUG_SETTLE_DELAY = 0.05
+
+# Times the watch moves down when directories appear while it's being set up
+HOTPLUG_WATCH_RETRIES = 8
+
+
+class SerialHotplugMonitor():
+    """
+    Watches the serial by-id directory with inotify and runs
+    the callback whenever serial devices appear or disappear.
+
+    While the directory doesn't exist (no devices connected),
+    its closest existing parent is watched for it instead.
+
+    The callback runs on a worker of its own, discovery talks to
+    the devices and would stall the shared notification thread.
+    """
+    def __init__(self, path: str, callback):
+        self._path = os.path.normpath(path)
+        self._callback = callback
+        self._loop = SerialEventLoop.instance()
+        self._libc = None
+        self._fd = None
+        self._wd = -1
+        self._watched = None
+        self._settle_pending = False
+        self._changed = Event()
+
+
+    @property
+    def active(self) -> bool:
+        return self._fd is not None
+
+
+    def start(self) -> bool:
+        """
+        Returns False if inotify isn't available
+        """
+        if self._fd is not None:
+            return True
+
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as error:
+            print(f"Hotplug monitor unavailable: {error}")
+            return False
+
+        if fd < 0:
+            print(f"Hotplug monitor unavailable: {os.strerror(ctypes.get_errno())}")
+            return False
+
+        self._fd = fd
+        if not self._watch():
+            self.stop()
+            return False
+
+        self._changed = Event()
+        Thread(target=self._discovery, args=(self._changed,), daemon=True, name="serial-hotplug").start()
+        self._loop.call_soon(self._loop.register, fd, selectors.EVENT_READ, self._handle_events)
+        return True
+
+
+    def stop(self) -> None:
+        fd = self._fd
+        if fd is None:
+            return
+
+        self._fd = None
+        self._changed.set()
+        self._loop.call_soon(self._close, fd)
+
+
+    def _close(self, fd: int) -> None:
+        self._loop.unregister(fd)
+        os.close(fd)
+
+
+    def _watch(self) -> bool:
+        """
+        A directory on the way can be created after the isdir check but
+        before its parent is watched, so the parent never reports it.
+        Check again once the watch is in place and move it down if needed.
+        """
+        for _ in range(HOTPLUG_WATCH_RETRIES):
+            if not self._watch_closest():
+                return False
+
+            if self._watched == self._path or not os.path.isdir(self._next_component()):
+                return True
+
+        return True
+
+
+    def _next_component(self) -> str:
+        relative = os.path.relpath(self._path, self._watched)
+        return os.path.join(self._watched, relative.split(os.sep)[0])
+
+
+    def _watch_closest(self) -> bool:
+        if self._wd >= 0:
+            self._libc.inotify_rm_watch(self._fd, self._wd)
+            self._wd = -1
+
+        path = self._path
+        while True:
+            if os.path.isdir(path):
+                self._wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), IN_WATCH_MASK)
+                if self._wd >= 0:
+                    self._watched = path
+                    return True
+
+                # Removed right under us, keep going up
+                if ctypes.get_errno() != errno.ENOENT:
+                    print(f"Can't watch {path}: {os.strerror(ctypes.get_errno())}")
+                    break
+
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+
+        self._watched = None
+        return False
+
+
+    def _handle_events(self, *_) -> None:
+        try:
+            data = os.read(self._fd, INOTIFY_READ_SIZE)
+        except (OSError, TypeError):
+            return
+
+        changed = False
+        rewatch = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length]
+            name = os.fsdecode(name.rstrip(b"\0"))
+            offset += INOTIFY_EVENT.size + length
+
+            if wd != self._wd:
+                continue
+
+            if mask & IN_IGNORED:
+                self._wd = -1
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                rewatch = True
+                changed = True
+
+            elif self._watched == self._path:
+                changed = True
+
+            # Only interested in the next component on the way to our path
+            elif self._on_path(os.path.join(self._watched, name)):
+                rewatch = True
+                changed = True
+
+        if rewatch:
+            self._watch()
+
+        if changed and not self._settle_pending:
+            self._settle_pending = True
+            self._loop.call_later(HOTPLUG_SETTLE_DELAY, self._settled)
+
+
+    def _on_path(self, path: str) -> bool:
+        return self._path == path or self._path.startswith(path + os.sep)
+
+
+    def _settled(self) -> None:
+        self._settle_pending = False
+        self._changed.set()
+
+
+    def _discovery(self, changed: Event) -> None:
+        """
+        Changes coming in while the callback runs are handled with one more run
+        """
+        while True:
+            changed.wait()
+            changed.clear()
+            if changed is not self._changed or self._fd is None:
+                break
+            self._callback()
@@ -2,23 +2,53 @@
 
 from sys import byteorder
 from binascii import hexlify
-from struct import pack, unpack
+from struct import Struct, pack, unpack, unpack_from
 import boxflat.bitwise as bitwise
 
 MOZA_COMMAND_READ=0
 MOZA_COMMAND_WRITE=1
 MOZA_COMMAND_DEAD=2
 
+MOZA_RESPONSE_BIT=7
+MOZA_WHEEL_GROUPS=range(63, 67)
+MOZA_HUB_GROUPS=(100, 228)
+MOZA_HUB_GROUP=100
+
+MOZA_CHECKSUM_BYTES=tuple(bytes((i,)) for i in range(256))
+
 class MozaCommand():
+    __slots__ = ("id", "read_group", "write_group", "name", "_length", "_payload",
+                 "_type", "_device_id", "_device_type", "_id_bytes", "_template")
+
     def __init__(self):
         self.id = 0
         self.read_group = 0
         self.write_group = 0
+        self.name = None
         self._length = 0
         self._payload = None
-        self._name = None
         self._type = None
         self._device_id = None
+        self._device_type = None
+        self._id_bytes = b""
+        self._template = None
+
+
+    @staticmethod
+    def from_template(template: "MozaCommandTemplate") -> "MozaCommand":
+        command = MozaCommand.__new__(MozaCommand)
+        command.id = template.id
+        command.read_group = template.read_group
+        command.write_group = template.write_group
+        command.name = template.name
+        command._length = template.length
+        command._payload = template.empty_payload
+        command._type = template.type
+        command._device_id = None
+        command._device_type = template.device_type
+        command._id_bytes = template.id_bytes
+        command._template = template
+        return command
 
 
     def set_data_from_name(self, name: str, commands_data: dict, device_name: str):
@@ -35,6 +65,8 @@ class MozaCommand():
         self.name = name
         self._type = commands[name]["type"]
         self._device_id = None
+        self._id_bytes = bytes(self.id)
+        self._template = None
 
 
     @staticmethod
@@ -96,7 +128,7 @@ class MozaCommand():
 
     @property
     def id_bytes(self) -> bytes:
-        return bytes(self.id)
+        return self._id_bytes
 
     @property
     def length(self) -> int:
@@ -122,6 +154,14 @@ class MozaCommand():
     def device_type(self) -> str:
         return self._device_type
 
+    @property
+    def response_key(self) -> tuple:
+        return self._device_type, self.read_group, self.id_bytes
+
+    @property
+    def ack_key(self) -> tuple:
+        return self._device_type, self.write_group, self.id_bytes
+
     @property
     def type(self) -> str:
         return self._type
@@ -149,7 +189,10 @@ class MozaCommand():
     def set_payload(self, value):
         data = None
         try:
-            if self._type == "int":
+            if self._template is not None:
+                data = self._template.pack(value)
+
+            elif self._type == "int":
                 data = int(value).to_bytes(self._length)
 
             elif self._type == "float":
@@ -170,7 +213,7 @@ class MozaCommand():
 
 
     def get_payload(self):
-        return self.value_from_data(self._payload, self._type)
+        return self.value_from_data(self._payload, self._type, self._length)
 
 
     @staticmethod
@@ -198,15 +241,16 @@ class MozaCommand():
 
 
     def checksum(self, data: bytes, magic_value: int) -> int:
-        value = magic_value
-        for d in data:
-            value += int(d)
-        return value % 256
+        return (magic_value + sum(data)) % 256
 
 
     def prepare_message(self, start_value: int,
                         rw: int, magic_value: int) -> bytes:
 
+        template = self._template
+        if template is not None and template.matches(start_value, magic_value):
+            return template.encode(rw, self._device_id, self._payload)
+
         ret = bytearray()
         ret.append(start_value)
         ret.append(self.length)
@@ -222,3 +266,238 @@ class MozaCommand():
         ret.append(self.checksum(ret, magic_value))
 
         return bytes(ret)
+
+
+
+def _prepare_encoder(value_type: str, length: int):
+    if value_type == "int":
+        return lambda value: int(value).to_bytes(length)
+
+    elif value_type == "float":
+        packer = Struct(">f")
+        return lambda value: packer.pack(float(value))
+
+    elif value_type == "array":
+        empty = bytes(length)
+        return lambda value: bytes(value[0:length]) if isinstance(value, list) else empty
+
+    elif value_type == "hex":
+        return bytes.fromhex
+
+    empty = bytes(length)
+    return lambda value: empty
+
+
+
+class MozaCommandTemplate():
+    """
+    Everything about a command that never changes, compiled once.
+    Frame headers are built on first use per direction and device id
+    together with their part of the checksum, so encoding a frame is
+    just header + payload + checksum byte.
+    """
+    __slots__ = ("name", "device_type", "id", "id_bytes", "read_group", "write_group",
+                 "length", "type", "empty_payload", "pack", "_start", "_magic", "_headers")
+
+    def __init__(self, name: str, device_type: str, data: dict, message_start: int, magic_value: int):
+        self.name = name
+        self.device_type = device_type
+        self.id = list(data["id"])
+        self.id_bytes = bytes(self.id)
+        self.read_group = int(data["read"])
+        self.write_group = int(data["write"])
+        self.length = int(data["bytes"])
+        self.type = data["type"]
+        self.empty_payload = bytes(self.length)
+        self.pack = _prepare_encoder(self.type, self.length)
+
+        self._start = message_start
+        self._magic = magic_value
+        self._headers: dict[tuple[int, int], tuple[bytes, int]] = {}
+
+
+    def matches(self, message_start: int, magic_value: int) -> bool:
+        return message_start == self._start and magic_value == self._magic
+
+
+    def _header(self, rw: int, device_id: int) -> tuple[bytes, int]:
+        group = self.read_group if rw == MOZA_COMMAND_READ else self.write_group
+        header = bytes((self._start, len(self.id_bytes) + self.length, group, device_id)) + self.id_bytes
+        self._headers[rw, device_id] = header, self._magic + sum(header)
+        return self._headers[rw, device_id]
+
+
+    def encode(self, rw: int, device_id: int, payload: bytes) -> bytes:
+        header = self._headers.get((rw, device_id))
+        if header is None:
+            header = self._header(rw, device_id)
+
+        return header[0] + payload + MOZA_CHECKSUM_BYTES[(header[1] + sum(payload)) % 256]
+
+
+
+class MozaCommandTemplates():
+    """
+    Templates of every command in the command database
+    """
+    def __init__(self, commands_data: dict, message_start: int, magic_value: int):
+        self._templates: dict[str, dict[str, MozaCommandTemplate]] = {
+            device_name: {
+                name: MozaCommandTemplate(name, device_name, data, message_start, magic_value)
+                for name, data in commands.items()
+            }
+            for device_name, commands in commands_data.items()
+        }
+
+
+    def get(self, device_name: str, command_name: str) -> MozaCommandTemplate:
+        return self._templates.get(device_name, {}).get(command_name)
+
+
+    def command(self, device_name: str, command_name: str) -> MozaCommand:
+        template = self.get(device_name, command_name)
+        if template is None:
+            return None
+        return MozaCommand.from_template(template)
+
+
+
+def _prepare_decoder(value_type: str, length: int, offset: int):
+    if value_type == "int":
+        end = offset + length
+        return lambda data: int.from_bytes(data[offset:end])
+
+    elif value_type == "float":
+        return lambda data: unpack_from(">f", data, offset)[0]
+
+    elif value_type == "array":
+        end = offset + length
+        return lambda data: list(data[offset:end])
+
+    elif value_type == "hex":
+        return lambda data: data[offset:].hex()
+
+    return lambda data: None
+
+
+
+class MozaResponseEntry():
+    __slots__ = ("name", "event", "key", "decode")
+
+    def __init__(self, name: str, event: str, key: tuple, decoder):
+        self.name = name
+        self.event = event
+        self.key = key
+        self.decode = decoder
+
+
+
+class MozaResponseDecoder():
+    """
+    Response lookup compiled once from the command database.
+    Maps (device, response group, command id) straight to the event
+    name and a prebuilt decoder, so no per-frame table scan is needed.
+    Write acknowledgements are indexed separately by write group.
+    """
+    def __init__(self, commands_data: dict, device_ids: dict):
+        # raw device byte in a response has its nibbles swapped
+        self._device_names = {bitwise.swap_nibbles(int(i)): name for i, name in device_ids.items()}
+        self._index: dict[str, dict[int, tuple]] = {}
+        self._acks: dict[str, dict[int, tuple]] = {}
+
+        for device_name, commands in commands_data.items():
+            self._index[device_name] = self._compile_device(device_name, commands, "read")
+            self._acks[device_name] = self._compile_device(device_name, commands, "write")
+
+
+    @staticmethod
+    def _compile_device(device_name: str, commands: dict, rw: str) -> dict[int, tuple]:
+        groups: dict[int, dict[int, dict[bytes, MozaResponseEntry]]] = {}
+
+        for name, values in commands.items():
+            group = int(values[rw])
+            if group == -1:
+                continue
+
+            command_id = bytes(values["id"])
+            offset = len(command_id)
+            decoder = _prepare_decoder(values["type"], int(values["bytes"]), offset)
+
+            ids = groups.setdefault(group, {}).setdefault(offset, {})
+            if command_id not in ids:
+                ids[command_id] = MozaResponseEntry(
+                    name, f"{device_name}-{name}", (device_name, group, command_id), decoder)
+
+        return {group: tuple(lengths.items()) for group, lengths in groups.items()}
+
+
+    def _resolve(self, values: bytes, device_name: str) -> tuple[str, int]:
+        if values is None or len(values) < 3:
+            return None, None
+
+        group = values[0] ^ (1 << MOZA_RESPONSE_BIT)
+        response_device = self._device_names.get(values[1])
+
+        if response_device is None:
+            return None, None
+
+        if device_name == "base" or device_name == "hub":
+            device_name = response_device
+
+        # Some ES wheels report on main/base IDs for some reason.
+        if group in MOZA_WHEEL_GROUPS:
+            device_name = "wheel"
+
+        # Hub reports on main ID
+        elif group in MOZA_HUB_GROUPS:
+            device_name = "hub"
+            group = MOZA_HUB_GROUP
+
+        return device_name, group
+
+
+    @staticmethod
+    def _find(index: dict, device_name: str, group: int, payload: bytes) -> MozaResponseEntry:
+        groups = index.get(device_name)
+        if groups is None:
+            return None
+
+        for id_length, ids in groups.get(group, ()):
+            entry = ids.get(payload[:id_length])
+            if entry is not None:
+                return entry
+
+        return None
+
+
+    def decode(self, values: bytes, device_name: str) -> tuple[str]:
+        _, event, value = self.decode_entry(values, device_name)
+        return event, value
+
+
+    def decode_entry(self, values: bytes, device_name: str) -> tuple[MozaResponseEntry, str]:
+        device_name, group = self._resolve(values, device_name)
+        if device_name is None:
+            return None, None, None
+
+        payload = values[2:]
+        entry = self._find(self._index, device_name, group, payload)
+        if entry is None:
+            return None, None, None
+
+        value = entry.decode(payload)
+        if entry.name == "output-y" and value > 100:
+            return entry, f"hpattern-{entry.name}", value
+
+        return entry, entry.event, value
+
+
+    def decode_ack(self, values: bytes, device_name: str) -> MozaResponseEntry:
+        """
+        Find the write command acknowledged by this response
+        """
+        device_name, group = self._resolve(values, device_name)
+        if device_name is None:
+            return None
+
+        return self._find(self._acks, device_name, group, values[2:])
@@ -200,11 +200,18 @@ class DashSettings(SettingsPanel):
 
     def _set_rpm_timings2_preset(self, index):
         # self._timing_row2.set_sliders_value(self._timings2[index], mute=False)
+        settings = {}
         for i, value in enumerate(self._timings2[index]):
-            self._cm.set_setting(value, f"dash-rpm-value{i+1}", exclusive=True)
-            time.sleep(0.005)
-            self._cm.set_setting(value, f"dash-rpm-value{i+1}")
-            time.sleep(0.005)
+            settings[f"dash-rpm-value{i+1}"] = value
+
+        # waiting for acks blocks, keep it off the main thread
+        Thread(daemon=True, target=self._write_rpm_timings2, args=[settings]).start()
+
+
+    def _write_rpm_timings2(self, settings: dict) -> None:
+        # resend whatever the dash didn't acknowledge
+        acks = self._cm.set_settings(settings, wait=True)
+        self._cm.set_settings({name: settings[name] for name, ack in acks.items() if not ack})
 
 
     def _get_rpm_timings2_preset(self, *args):
@@ -229,11 +236,15 @@ class DashSettings(SettingsPanel):
     def _dash_rpm_test(self, *args):
         self._cm.set_setting(0, "dash-send-telemetry")
         time.sleep(0.2)
-        initial_mode = self._cm.get_setting("dash-rpm-indicator-mode", exclusive=True)
-        initial_flag_mode = self._cm.get_setting("dash-flags-indicator-mode", exclusive=True)
+        with self._cm.session("dash") as dash:
+            initial_mode = dash.get_setting("dash-rpm-indicator-mode")
+            initial_flag_mode = dash.get_setting("dash-flags-indicator-mode")
 
-        self._cm.set_setting(1, "dash-rpm-indicator-mode", exclusive=True)
-        self._cm.set_setting(1, "dash-flags-indicator-mode", exclusive=True)
+            # acknowledged before any telemetry frame can go out
+            dash.set_settings({
+                "dash-rpm-indicator-mode"   : 1,
+                "dash-flags-indicator-mode" : 1,
+            }, wait=True, force=True)
 
         t = 0.08
         for i in range(10):
@@ -296,42 +307,37 @@ class DashSettings(SettingsPanel):
         self._cm.set_setting([0,0,255] * 6, "dash-flag-colors")
         time.sleep(.9)
 
-        self._cm.set_setting(initial_mode, "dash-rpm-indicator-mode", exclusive=True)
-        self._cm.set_setting(initial_mode, "dash-flags-indicator-mode", exclusive=True)
+        with self._cm.session("dash") as dash:
+            dash.set_setting(initial_mode, "dash-rpm-indicator-mode")
+            dash.set_setting(initial_flag_mode, "dash-flags-indicator-mode")
 
 
     def reset(self, *_) -> None:
-        self._set_rpm_timings_preset(0)
-        self._set_rpm_timings2_preset(0)
-
-        self._cm.set_setting(1, "dash-rpm-indicator-mode")
-        self._cm.set_setting(1, "dash-flags-indicator-mode")
-        self._cm.set_setting(0, "dash-rpm-display-mode")
-        self._cm.set_setting(0, "dash-rpm-mode")
-
-        self._set_rpm_timings_preset(0)
-        self._set_rpm_timings2_preset(0)
+        settings = {
+            "dash-rpm-indicator-mode"   : 1,
+            "dash-flags-indicator-mode" : 1,
+            "dash-rpm-display-mode"     : 0,
+            "dash-rpm-mode"             : 0,
+            "dash-rpm-interval"         : 250,
+            "dash-rpm-brightness"       : 15,
+            "dash-flags-brightness"     : 15,
+        }
 
-        self._cm.set_setting(250, "dash-rpm-interval")
+        for i in range(MOZA_RPM_LEDS):
+            color = [0, 255, 0]
+            if i >= 7:
+                color = [255, 0, 255]
+            elif i >= 3:
+                color = [255, 0, 0]
+            settings[f"dash-rpm-color{i+1}"] = color
 
-        self._cm.set_setting([0, 255, 0], f"dash-rpm-color1")
-        self._cm.set_setting([0, 255, 0], f"dash-rpm-color2")
-        self._cm.set_setting([0, 255, 0], f"dash-rpm-color3")
+        for i in range(MOZA_FLAG_LEDS):
+            settings[f"dash-flag-color{i+1}"] = [255, 0, 255]
 
-        self._cm.set_setting([255, 0, 0], f"dash-rpm-color4")
-        self._cm.set_setting([255, 0, 0], f"dash-rpm-color5")
-        self._cm.set_setting([255, 0, 0], f"dash-rpm-color6")
-        self._cm.set_setting([255, 0, 0], f"dash-rpm-color7")
+        self._cm.set_settings(settings)
 
-        self._cm.set_setting([255, 0, 255], f"dash-rpm-color8")
-        self._cm.set_setting([255, 0, 255], f"dash-rpm-color9")
-        self._cm.set_setting([255, 0, 255], f"dash-rpm-color10")
+        self._set_rpm_timings_preset(0)
+        self._set_rpm_timings2_preset(0)
 
         for i in range(MOZA_RPM_LEDS):
             self._blinking_row.set_led_value([0, 255, 255], i, mute=False)
-
-        for i in range(MOZA_FLAG_LEDS):
-            self._cm.set_setting([255, 0, 255], f"dash-flag-color{i+1}")
-
-        self._cm.set_setting(15, "dash-rpm-brightness")
-        self._cm.set_setting(15, "dash-flags-brightness")
@@ -27,6 +27,7 @@ class SettingsPanel(EventDispatcher):
         self._groups: list[BoxflatPreferencesGroup] = []
 
         self._active = True
+        self._shown = False
         self._shutdown = False
 
         self._banner = self._prepare_banner()
@@ -44,6 +45,9 @@ class SettingsPanel(EventDispatcher):
         self._button = self._prepare_button(title, button_callback)
         self.prepare_ui()
 
+        if self._cm is not None:
+            self._cm.set_polling_scope(None)
+
 
     def _prepare_button(self, title, button_callback) -> Gtk.ToggleButton:
         button = Gtk.ToggleButton()
@@ -126,6 +130,31 @@ class SettingsPanel(EventDispatcher):
         self._button.set_active(False)
 
 
+    @property
+    def polling_scope(self) -> str:
+        if self._current_stack is None:
+            return self._page_scope()
+        return self._page_scope(self._current_stack.get_visible_child_name())
+
+
+    def _page_scope(self, name="") -> str:
+        return f"{self.title}/{name}"
+
+
+    def set_shown(self, value: bool) -> None:
+        """
+        Called when the panel is switched to/from, polling follows the page on screen
+        """
+        self._shown = value
+        if value and self._cm is not None:
+            self._cm.set_visible_scope(self.polling_scope)
+
+
+    def _visible_page_changed(self, *_) -> None:
+        if self._shown and self._cm is not None:
+            self._cm.set_visible_scope(self.polling_scope)
+
+
     def active(self, value: int):
         value = (value > -1)
         if value == self._active:
@@ -153,6 +182,9 @@ class SettingsPanel(EventDispatcher):
         page = Adw.PreferencesPage()
         self._current_page = page
 
+        if self._cm is not None:
+            self._cm.set_polling_scope(self._page_scope(name if self._current_stack else ""))
+
         if self._current_stack is None:
             self._content.set_child(page)
         else:
@@ -178,6 +210,7 @@ class SettingsPanel(EventDispatcher):
 
     def add_view_stack(self):
         stack = Adw.ViewStack()
+        stack.connect("notify::visible-child-name", self._visible_page_changed)
         self._content.set_child(stack)
         self._current_stack = stack
 
@@ -1,7 +1,7 @@
 # Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
 
 from boxflat.panels.settings_panel import SettingsPanel
-from boxflat.connection_manager import MozaConnectionManager
+from boxflat.connection_manager import MozaConnectionManager, CM_SHADOW_MAX_AGE
 from boxflat.bitwise import *
 from boxflat.widgets import *
 
@@ -381,11 +381,18 @@ class WheelSettings(SettingsPanel):
 
     def _set_rpm_timings2_preset(self, index):
         # self._timing_row2.set_sliders_value(self._timings2[index], mute=False)
+        settings = {}
         for i, value in enumerate(self._timings2[index]):
-            self._cm.set_setting(value, f"wheel-rpm-value{i+1}", exclusive=True)
-            time.sleep(0.005)
-            self._cm.set_setting(value, f"wheel-rpm-value{i+1}")
-            time.sleep(0.005)
+            settings[f"wheel-rpm-value{i+1}"] = value
+
+        # waiting for acks blocks, keep it off the main thread
+        Thread(daemon=True, target=self._write_rpm_timings2, args=[settings]).start()
+
+
+    def _write_rpm_timings2(self, settings: dict) -> None:
+        # resend whatever the wheel didn't acknowledge
+        acks = self._cm.set_settings(settings, wait=True)
+        self._cm.set_settings({name: settings[name] for name, ack in acks.items() if not ack})
 
 
     def _get_rpm_timings2_preset(self, *args):
@@ -464,8 +471,10 @@ class WheelSettings(SettingsPanel):
     def _wheel_rpm_test(self, *args):
         self._write_telemetry(0)
         time.sleep(0.2)
-        initial_mode = self._cm.get_setting("wheel-telemetry-mode", exclusive=True)
-        self._cm.set_setting(1, "wheel-telemetry-mode", exclusive=True)
+        with self._cm.session("wheel") as wheel:
+            initial_mode = wheel.get_setting("wheel-telemetry-mode")
+            # acknowledged before any telemetry frame can go out
+            wheel.set_settings({"wheel-telemetry-mode": 1}, wait=True, force=True)
 
         val = []
         val2 = []
@@ -521,71 +530,53 @@ class WheelSettings(SettingsPanel):
             time.sleep(t)
 
         time.sleep(0.8)
-        self._cm.set_setting(initial_mode, "wheel-telemetry-mode", exclusive=True)
+        with self._cm.session("wheel") as wheel:
+            wheel.set_setting(initial_mode, "wheel-telemetry-mode")
 
 
     def reset(self, *_) -> None:
         # self._set_rpm_timings_preset(0)
         # self._set_rpm_timings2_preset(0)
 
-        self._cm.set_setting(1, "wheel-idle-mode")
-        self._cm.set_setting(10, "wheel-idle-timeout")
-        self._cm.set_setting(2500, "wheel-idle-speed")
-        self._cm.set_setting([255] * 3, "wheel-idle-color")
-
-        self._cm.set_setting(1, "wheel-telemetry-mode")
-        self._cm.set_setting(256, "wheel-stick-mode")
-        # self._cm.set_setting(0, "wheel-rpm-mode")
-        self._cm.set_setting(2, "wheel-paddles-mode")
-        self._cm.set_setting(50, "wheel-clutch-point")
-        self._cm.set_setting(0, "wheel-knob-mode")
-        # self._cm.set_setting(256, "wheel-stick-mode")
-
-        # self._set_rpm_timings_preset(0)
-        # self._set_rpm_timings2_preset(0)
+        settings = {
+            "wheel-idle-mode"          : 1,
+            "wheel-idle-timeout"       : 10,
+            "wheel-idle-speed"         : 2500,
+            "wheel-idle-color"         : [255] * 3,
+            "wheel-telemetry-mode"     : 1,
+            "wheel-stick-mode"         : 256,
+            # "wheel-rpm-mode"         : 0,
+            "wheel-paddles-mode"       : 2,
+            "wheel-clutch-point"       : 50,
+            "wheel-knob-mode"          : 0,
+            # "wheel-rpm-interval"     : 250,
+        }
 
-        # self._cm.set_setting(250, "wheel-rpm-interval")
-
-        self._cm.set_setting([0, 255, 0], "wheel-rpm-color1")
-        self._cm.set_setting([0, 255, 0], "wheel-rpm-color2")
-        self._cm.set_setting([0, 255, 0], "wheel-rpm-color3")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color4")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color5")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color6")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color7")
-        self._cm.set_setting([0, 0, 255], "wheel-rpm-color8")
-        self._cm.set_setting([0, 0, 255], "wheel-rpm-color9")
-        self._cm.set_setting([0, 0, 255], "wheel-rpm-color10")
-
-        self._cm.set_setting([0, 255, 0], "wheel-rpm-color1")
-        self._cm.set_setting([0, 255, 0], "wheel-rpm-color2")
-        self._cm.set_setting([0, 255, 0], "wheel-rpm-color3")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color4")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color5")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color6")
-        self._cm.set_setting([255, 0, 0], "wheel-rpm-color7")
-        self._cm.set_setting([0, 0, 255], "wheel-rpm-color8")
-        self._cm.set_setting([0, 0, 255], "wheel-rpm-color9")
-        self._cm.set_setting([0, 0, 255], "wheel-rpm-color10")
+        for i in range(MOZA_RPM_LEDS):
+            color = [0, 255, 0]
+            if i >= 7:
+                color = [0, 0, 255]
+            elif i >= 3:
+                color = [255, 0, 0]
+            settings[f"wheel-rpm-color{i+1}"] = color
 
         # for i in range(MOZA_RPM_LEDS):
         #     self._blinking_row.set_led_value([0, 255, 255], i, mute=False)
 
         # for i in range(14 if self._tsw_row.get_active() else 10):
-        #     self._cm.set_setting([0, 255, 255], f"wheel-button-color{i+1}")
-        #     sleep(0.01)
+        #     settings[f"wheel-button-color{i+1}"] = [0, 255, 255]
 
         # for i in range(MOZA_FLAG_LEDS):
-        #     self._cm.set_setting([255, 0, 0], f"wheel-flag-color{i+1}")
+        #     settings[f"wheel-flag-color{i+1}"] = [255, 0, 0]
 
-        self._idle_buttons_speed.set_value(2500, mute=False)
-        self._cm.set_setting(1, "wheel-buttons-idle-effect")
+        settings["wheel-buttons-idle-effect"] = 1
+        settings["wheel-telemetry-idle-effect"] = 2
+        settings["wheel-rpm-brightness"] = 100
+        settings["wheel-buttons-brightness"] = 100
+        self._cm.set_settings(settings)
 
+        self._idle_buttons_speed.set_value(2500, mute=False)
         self._idle_telemetry_speed.set_value(2500, mute=False)
-        self._cm.set_setting(2, "wheel-telemetry-idle-effect")
-
-        self._cm.set_setting(100, "wheel-rpm-brightness")
-        self._cm.set_setting(100, "wheel-buttons-brightness")
         self._set_combination_settings([0] * 8)
 
 
@@ -617,7 +608,7 @@ class WheelSettings(SettingsPanel):
             self._tsw_row.set_present(1)
             return
 
-        for i in range(4):
-            value = self._cm.get_setting(f"wheel-button-color{i+11}")
+        values = self._cm.get_settings([f"wheel-button-color{i+11}" for i in range(4)], max_age=CM_SHADOW_MAX_AGE)
+        for i, value in enumerate(values.values()):
             self._tsw_row.set_led_value(value, i)
 
@@ -408,8 +408,9 @@ class OldWheelSettings(SettingsPanel):
     def _wheel_rpm_test(self, *args):
         self._cm.set_setting(0, "wheel-old-send-telemetry")
         time.sleep(0.2)
-        initial_mode = self._cm.get_setting("wheel-rpm-indicator-mode", exclusive=True)
-        self._cm.set_setting(1, "wheel-rpm-indicator-mode", exclusive=True)
+        with self._cm.session("wheel") as wheel:
+            initial_mode = wheel.get_setting("wheel-rpm-indicator-mode")
+            wheel.set_setting(1, "wheel-rpm-indicator-mode")
 
         t = 0.1
         for j in range(2):
@@ -489,7 +490,8 @@ class OldWheelSettings(SettingsPanel):
         self._cm.set_setting([0, 0, 255] * 3, "wheel-flag-colors2")
         time.sleep(0.9)
 
-        self._cm.set_setting(initial_mode, "wheel-rpm-indicator-mode", exclusive=True)
+        with self._cm.session("wheel") as wheel:
+            wheel.set_setting(initial_mode, "wheel-rpm-indicator-mode")
 
 
     def reset(self, *_) -> None:
@@ -0,0 +1,183 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import re
+import heapq
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+POLL_PRIORITY_LIVE=0
+POLL_PRIORITY_STATUS=1
+POLL_PRIORITY_SETTING=2
+
+POLL_DEFAULT_INTERVAL=5
+
+# Defaults by command class, first match wins
+POLL_CLASSES=(
+    (re.compile(r"-(mcu|mosfet|motor)-temp$"), 1, POLL_PRIORITY_LIVE),
+    (re.compile(r"-state(-err)?$"), 1, POLL_PRIORITY_LIVE),
+    (re.compile(r"-output(-[xy])?$"), 0.5, POLL_PRIORITY_LIVE),
+    (re.compile(r"^hub-|-status$"), 2, POLL_PRIORITY_STATUS),
+)
+
+
+def poll_settings(command_name: str, data: dict) -> tuple[float, int]:
+    """
+    Refresh interval and priority of a command.
+    serial.yml can override the interval with a "poll" key, 0 disables polling.
+    """
+    interval, priority = POLL_DEFAULT_INTERVAL, POLL_PRIORITY_SETTING
+    for pattern, class_interval, class_priority in POLL_CLASSES:
+        if pattern.search(command_name):
+            interval, priority = class_interval, class_priority
+            break
+
+    interval = float(data.get("poll", interval))
+    return interval, priority
+
+
+
+class PollingScheduler():
+    """
+    Keeps every polled command on its own schedule. Commands of the same
+    interval are staggered so reads are spread out instead of bursting.
+    When several commands are due, the highest priority goes first.
+    """
+    def __init__(self):
+        self._commands: dict[str, tuple[float, int]] = {}
+        self._counts: dict[str, int] = {}
+        self._polled_at: dict[str, float] = {}
+        self._queue = []
+        self._ready = []
+        self._scheduled = set()
+        self._sequence = count()
+        self._lock = Lock()
+
+
+    def add(self, command_name: str, interval: float, priority=POLL_PRIORITY_SETTING) -> None:
+        with self._lock:
+            self._commands[command_name] = (interval, priority)
+            self._counts.setdefault(command_name, 0)
+
+
+    def set_interval(self, command_name: str, interval: float, priority: int=None) -> None:
+        with self._lock:
+            if command_name not in self._commands:
+                return
+
+            old_interval, old_priority = self._commands[command_name]
+            if priority is None:
+                priority = old_priority
+
+            self._commands[command_name] = (interval, priority)
+            self._remove(command_name)
+            if interval > 0:
+                self._push(command_name, monotonic() + min(interval, old_interval))
+
+
+    def expedite(self, command_names) -> None:
+        """
+        Make commands due right away
+        """
+        now = monotonic()
+        with self._lock:
+            for command_name in command_names:
+                if self._commands.get(command_name, (0, 0))[0] <= 0:
+                    continue
+
+                self._remove(command_name)
+                self._push(command_name, now)
+
+
+    def get_interval(self, command_name: str) -> float:
+        return self._commands.get(command_name, (0, 0))[0]
+
+
+    def last_polled(self, command_name: str) -> float:
+        """
+        When the last poll of a command went out, 0 if it never did
+        """
+        return self._polled_at.get(command_name, 0.0)
+
+
+    def reset(self) -> None:
+        """
+        Schedule everything from scratch, staggered within each interval
+        """
+        now = monotonic()
+        with self._lock:
+            self._queue.clear()
+            self._ready.clear()
+            self._scheduled.clear()
+
+            classes: dict[float, list[str]] = {}
+            for command_name, (interval, _) in self._commands.items():
+                if interval > 0:
+                    classes.setdefault(interval, []).append(command_name)
+
+            for interval, commands in classes.items():
+                step = interval / len(commands)
+                for i, command_name in enumerate(commands):
+                    self._push(command_name, now + i * step)
+
+
+    def pop(self) -> tuple[str, float]:
+        """
+        Returns the next due command or None and the time left until one is due
+        """
+        now = monotonic()
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                due, _, command_name = heapq.heappop(self._queue)
+                heapq.heappush(self._ready, (self._commands[command_name][1], due, command_name))
+
+            if self._ready:
+                _, due, command_name = heapq.heappop(self._ready)
+                self._scheduled.discard(command_name)
+                return command_name, 0
+
+            if not self._queue:
+                return None, None
+
+            return None, self._queue[0][0] - now
+
+
+    def done(self, command_name: str, polled=True, last_update: float=None) -> None:
+        """
+        Schedule the next poll, one interval after the last known value
+        """
+        now = monotonic()
+        with self._lock:
+            interval = self._commands[command_name][0]
+            if interval <= 0:
+                return
+
+            if polled:
+                self._counts[command_name] += 1
+                self._polled_at[command_name] = now
+
+            # Rescheduled in the meantime
+            if command_name in self._scheduled:
+                return
+
+            if last_update is None:
+                last_update = now
+            self._push(command_name, max(last_update + interval, now))
+
+
+    def poll_counts(self) -> dict[str, int]:
+        with self._lock:
+            return self._counts.copy()
+
+
+    def _push(self, command_name: str, due: float) -> None:
+        self._scheduled.add(command_name)
+        heapq.heappush(self._queue, (due, next(self._sequence), command_name))
+
+
+    def _remove(self, command_name: str) -> None:
+        self._scheduled.discard(command_name)
+        self._queue = [entry for entry in self._queue if entry[2] != command_name]
+        heapq.heapify(self._queue)
+        self._ready = [entry for entry in self._ready if entry[2] != command_name]
+        heapq.heapify(self._ready)
@@ -1,6 +1,6 @@
 # Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
 
-from .connection_manager import MozaConnectionManager
+from .connection_manager import MozaConnectionManager, CM_SHADOW_MAX_AGE
 from .moza_command import MozaCommand
 import yaml
 import os
@@ -325,6 +325,7 @@ class MozaPresetHandler(SimpleEventDispatcher):
         preset_data = self._get_preset_data() or {}
         preset_data["BoxflatPresetVersion"] = "1"
         paddles = 0
+        requests: dict[str, tuple[str, str]] = {}
 
         for device, settings in self._settings.items():
             if device not in preset_data.keys():
@@ -339,26 +340,25 @@ class MozaPresetHandler(SimpleEventDispatcher):
                 continue
 
             if device == "wheel":
-                paddles = self._cm.get_setting("wheel-paddles-mode")
+                paddles = self._cm.get_setting("wheel-paddles-mode", max_age=CM_SHADOW_MAX_AGE)
 
             for setting in settings:
-                tries = 0
-                while tries < 3:
-                    tries += 1
-                    replace = setting.replace("set-", "get-")
+                replace = setting.replace("set-", "get-")
 
-                    if "button-color" in setting and paddles is not None:
-                        index = int(setting.lstrip("button-color"))
-                        if 11 <= index <= 14:
-                            # print(f"skipping button {index}, not TSW")
-                            break
+                if "button-color" in setting and paddles is not None:
+                    index = int(setting.lstrip("button-color"))
+                    if 11 <= index <= 14:
+                        # print(f"skipping button {index}, not TSW")
+                        continue
 
-                    value = self._cm.get_setting(f"{device}-{replace}")
+                requests[f"{device}-{replace}"] = (device, setting)
 
-                    if value == -1 or value is None:
-                        continue
-                    preset_data[device][setting] = value
-                    tries = 3
+        values = self._cm.get_settings(list(requests.keys()), retries=2, max_age=CM_SHADOW_MAX_AGE)
+        for command, (device, setting) in requests.items():
+            value = values[command]
+            if value == -1 or value is None:
+                continue
+            preset_data[device][setting] = value
 
         process_name = self.get_linked_process()
         default = self.is_default()
@@ -380,6 +380,7 @@ class MozaPresetHandler(SimpleEventDispatcher):
             return
 
         paddles = 0
+        values = {}
         for key, settings in preset_data.items():
             if key not in MozaDevicePresetSettings.keys():
                 continue
@@ -393,7 +394,7 @@ class MozaPresetHandler(SimpleEventDispatcher):
                 continue
 
             if key == "wheel":
-                paddles = self._cm.get_setting("wheel-paddles-mode")
+                paddles = self._cm.get_setting("wheel-paddles-mode", max_age=CM_SHADOW_MAX_AGE)
 
             for setting, value in settings.items():
                 if value is None or value == -1:
@@ -416,8 +417,9 @@ class MozaPresetHandler(SimpleEventDispatcher):
 
                 setting = setting.replace("get-", "set-").replace("-end", "-max").replace("-start", "-min")
                 # print(f"{key}-{setting}: {value}")
-                self._cm.set_setting(value, f"{key}-{setting}", exclusive = True)
+                values[f"{key}-{setting}"] = value
 
+        self._cm.set_settings(values)
         self._dispatch()
 
 
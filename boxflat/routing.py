@@ -0,0 +1,95 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+from threading import Lock
+from time import monotonic
+
+# Ports that can forward frames to devices without their own USB connection
+ROUTE_CANDIDATES=("base", "hub")
+ROUTE_MAX_MISSES=3
+
+
+class Route():
+    __slots__ = ("port", "misses", "timestamp")
+
+    def __init__(self, port: str):
+        self.port = port
+        self.misses = 0
+        self.timestamp = monotonic()
+
+
+    @property
+    def age(self) -> float:
+        return monotonic() - self.timestamp
+
+
+
+class RoutingTable():
+    """
+    Which serial port actually reaches every logical device.
+
+    Devices with their own USB connection are always talked to directly.
+    Others are learned from the port their responses arrive on. Until then,
+    or after a route stops responding, frames go out on every candidate.
+    """
+    def __init__(self, max_misses=ROUTE_MAX_MISSES):
+        self._routes: dict[str, Route] = {}
+        self._max_misses = max_misses
+        self._lock = Lock()
+
+
+    def resolve(self, device_type: str, ports) -> list[str]:
+        if device_type in ports:
+            return [device_type]
+
+        route = self._routes.get(device_type)
+        if route is not None and route.port in ports:
+            return [route.port]
+
+        return [port for port in ROUTE_CANDIDATES if port in ports]
+
+
+    def learn(self, device_type: str, port: str) -> None:
+        if device_type == port:
+            return
+
+        with self._lock:
+            route = self._routes.get(device_type)
+            if route is None:
+                self._routes[device_type] = Route(port)
+                # print(f"Routing {device_type} through {port}")
+                return
+
+            # Duplicate response from a broadcast, keep the first path
+            if route.port != port:
+                return
+
+            route.misses = 0
+            route.timestamp = monotonic()
+
+
+    def miss(self, device_type: str) -> None:
+        with self._lock:
+            route = self._routes.get(device_type)
+            if route is None:
+                return
+
+            route.misses += 1
+            if route.misses >= self._max_misses:
+                # print(f"Route {device_type} -> {route.port} lost")
+                del self._routes[device_type]
+
+
+    def forget_port(self, port: str) -> None:
+        with self._lock:
+            for device_type in [d for d, r in self._routes.items() if r.port == port]:
+                del self._routes[device_type]
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+    def routes(self) -> dict[str, str]:
+        with self._lock:
+            return {device_type: route.port for device_type, route in self._routes.items()}
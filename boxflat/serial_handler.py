@@ -1,125 +1,735 @@
 # Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
 
-import multiprocessing as mp
-mp.set_start_method("fork")
-
-from threading import Thread
-from multiprocessing import Process, Queue, Event
+import os
+import io
+import heapq
+import fcntl
+import termios
+import selectors
+from array import array
+from collections import deque
+from itertools import count
+from threading import Thread, Lock, Event, get_ident
+from queue import SimpleQueue
+from time import monotonic
 from serial import Serial
 from boxflat.subscription import SimpleEventDispatcher
-from time import sleep
 
 from boxflat.moza_command import MozaCommand
+from boxflat import tracing
+
+SERIAL_RECONNECT_DELAY = 0.2
+SERIAL_READ_SIZE = 4096
+SERIAL_BUFFER_SIZE = 8192
+
+# Bytes the kernel may hold before lower lanes have to wait,
+# keeps head-of-line blocking for safety frames bounded
+SERIAL_OUTQ_LIMIT = 256
+SERIAL_OUTQ_RETRY = 0.001
+
+WRITE_LANE_SAFETY = 0
+WRITE_LANE_TELEMETRY = 1
+WRITE_LANE_INTERACTIVE = 2
+WRITE_LANE_BULK = 3
+WRITE_LANE_NAMES = ("safety", "telemetry", "interactive", "bulk")
+
+SERIAL_STAT_TX_FRAMES = 0
+SERIAL_STAT_TX_BYTES = 1
+SERIAL_STAT_RX_FRAMES = 2
+SERIAL_STAT_RX_BYTES = 3
+SERIAL_STAT_QUEUE_HIGH_WATER = 4
+SERIAL_STAT_NAMES = ("tx-frames", "tx-bytes", "rx-frames", "rx-bytes", "queue-high-water")
+
+# start + length + group + device + checksum
+FRAME_OVERHEAD = 5
+FRAME_MIN_PAYLOAD = 2
+FRAME_MAX_PAYLOAD = 64
+
+
+class MozaFrameParser():
+    """
+    Incremental parser for the Moza serial protocol.
+    Data lands directly in a preallocated buffer and every complete
+    frame is split out in one pass. Frames with a bad length or
+    checksum are dropped byte by byte until the stream resyncs.
+    """
+    def __init__(self, message_start: int, magic_value: int, size=SERIAL_BUFFER_SIZE):
+        self._message_start = message_start
+        self._magic_value = magic_value
+
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._head = 0
+        self._tail = 0
+
+        self.frames_parsed = 0
+        self.checksum_errors = 0
+        self.bytes_dropped = 0
+
+
+    @property
+    def free_space(self) -> int:
+        return len(self._buffer) - self._tail
+
+
+    def reset(self) -> None:
+        self._head = 0
+        self._tail = 0
+
+
+    def fill(self, stream: io.RawIOBase) -> int:
+        """
+        Read as much as fits from a non-blocking stream.
+        Returns None if the stream had no data.
+        """
+        self._compact()
+        count = stream.readinto(self._view[self._tail:])
+        if count:
+            self._tail += count
+        return count
+
+
+    def filled(self, count: int) -> memoryview:
+        """
+        Data that came in with the last fill
+        """
+        return self._view[self._tail - count:self._tail]
+
+
+    def feed(self, data: bytes) -> None:
+        self._compact()
+        if len(data) > self.free_space:
+            self.bytes_dropped += self._tail - self._head
+            self.reset()
+            data = data[-len(self._buffer):]
+
+        self._buffer[self._tail:self._tail + len(data)] = data
+        self._tail += len(data)
+
+
+    def frames(self) -> list[bytes]:
+        """
+        Returns group, device id and payload of every complete frame
+        """
+        frames = []
+        buffer = self._buffer
+        head = self._head
+        tail = self._tail
+
+        while head < tail:
+            start = buffer.find(self._message_start, head, tail)
+            if start < 0:
+                self.bytes_dropped += tail - head
+                head = tail
+                break
+
+            self.bytes_dropped += start - head
+            head = start
+            if tail - head < 2:
+                break
+
+            payload_length = buffer[head + 1]
+            if not FRAME_MIN_PAYLOAD <= payload_length <= FRAME_MAX_PAYLOAD:
+                self.bytes_dropped += 1
+                head += 1
+                continue
 
+            frame_end = head + payload_length + FRAME_OVERHEAD
+            if frame_end > tail:
+                break
+
+            checksum = (self._magic_value + sum(self._view[head:frame_end-1])) % 256
+            if checksum != buffer[frame_end - 1]:
+                self.checksum_errors += 1
+                self.bytes_dropped += 1
+                head += 1
+                continue
+
+            frames.append(bytes(self._view[head+2:frame_end-1]))
+            head = frame_end
+
+        self.frames_parsed += len(frames)
+        self._head = head
+        if head == tail:
+            self.reset()
+
+        return frames
+
+
+    def _compact(self) -> None:
+        if self._head == 0:
+            return
+
+        remaining = self._tail - self._head
+        self._buffer[:remaining] = self._view[self._head:self._tail]
+        self._head = 0
+        self._tail = remaining
+
+
+
+class WriteLane():
+    __slots__ = ("queue", "bytes", "high_water", "sent", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.queue: deque[tuple[bytes, float]] = deque()
+        self.bytes = 0
+        self.high_water = 0
+        self.sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+    def push(self, message: bytes) -> None:
+        self.queue.append((message, monotonic()))
+        self.bytes += len(message)
+        self.high_water = max(self.high_water, len(self.queue))
+
+
+    def pop(self) -> bytes:
+        message, queued = self.queue.popleft()
+        wait = monotonic() - queued
+
+        self.bytes -= len(message)
+        self.sent += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        return message
+
+
+    def clear(self) -> None:
+        self.queue.clear()
+        self.bytes = 0
+
+
+    def stats(self) -> dict:
+        return {
+            "depth"       : len(self.queue),
+            "bytes"       : self.bytes,
+            "high-water"  : self.high_water,
+            "sent"        : self.sent,
+            "wait-avg-ms" : self.wait_total / self.sent * 1000 if self.sent else 0.0,
+            "wait-max-ms" : self.wait_max * 1000,
+        }
+
+
+
+class SerialEventLoop():
+    """
+    One selector loop shared by every serial device.
+    Notifications are handed off to a single worker thread,
+    so slow subscribers never stall the serial I/O.
+    """
+    _instance = None
+    _instance_lock = Lock()
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._calls = SimpleQueue()
+        self._notifications = SimpleQueue()
+        self._timers = []
+        self._timer_sequence = count()
+        self._handlers = set()
+
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+
+        self._notification_thread = Thread(target=self._notification_handler, daemon=True, name="serial-notify")
+        self._loop_thread = Thread(target=self._loop, daemon=True, name="serial-loop")
+        self._loop_thread.start()
+        self._notification_thread.start()
+
+
+    @classmethod
+    def instance(cls) -> "SerialEventLoop":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = SerialEventLoop()
+            return cls._instance
+
+
+    @classmethod
+    def in_notification_thread(cls) -> bool:
+        """
+        Called from a subscriber, which must never block
+        """
+        instance = cls._instance
+        return instance is not None and instance._notification_thread.ident == get_ident()
+
+
+    def call_soon(self, callback, *args) -> None:
+        self._calls.put((callback, args))
+        self._wakeup()
+
+
+    def call_later(self, delay: float, callback, *args) -> None:
+        """
+        Only safe to call from the loop thread
+        """
+        heapq.heappush(self._timers, (monotonic() + delay, next(self._timer_sequence), callback, args))
+
+
+    def notify(self, callback, *args) -> None:
+        self._notifications.put((callback, args))
 
-class SerialHandler(SimpleEventDispatcher):
-    def __init__(self, serial_path: str, msg_start: int, device_name: str):
-        super().__init__()
-        self._read_queue = Queue()
-        self._text_read_queue = Queue()
-        self._write_queue = Queue()
 
-        self._serial_available = Event()
-        self._shutdown = Event()
+    def sync(self, timeout: float=None) -> bool:
+        """
+        Wait until every call queued before this one has run
+        """
+        if self._loop_thread.ident == get_ident():
+            return True
 
+        done = Event()
+        self.call_soon(done.set)
+        return done.wait(timeout)
+
+
+    def attach(self, handler) -> None:
+        self._handlers.add(handler)
+
+
+    def detach(self, handler) -> None:
+        self._handlers.discard(handler)
+
+
+    @property
+    def handlers(self) -> int:
+        """
+        Serial handlers that weren't stopped yet
+        """
+        return len(self._handlers)
+
+
+    def register(self, fd: int, events: int, callback) -> None:
+        self._selector.register(fd, events, callback)
+
+
+    def modify(self, fd: int, events: int, callback) -> None:
+        self._selector.modify(fd, events, callback)
+
+
+    def unregister(self, fd: int) -> None:
+        try:
+            self._selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+
+    def _wakeup(self) -> None:
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            pass
+
+
+    def _drain_wakeup(self, *_) -> None:
+        try:
+            while os.read(self._wakeup_read, SERIAL_READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+
+    def _run(self, callback, *args) -> None:
+        try:
+            callback(*args)
+        except Exception as error:
+            print(f"Serial loop error: {error}")
+
+
+    def _loop(self) -> None:
+        while True:
+            timeout = None
+            if self._timers:
+                timeout = max(0, self._timers[0][0] - monotonic())
+
+            for key, mask in self._selector.select(timeout):
+                if key.fd == self._wakeup_read:
+                    self._drain_wakeup()
+                    continue
+                self._run(key.data, mask)
+
+            while not self._calls.empty():
+                callback, args = self._calls.get()
+                self._run(callback, *args)
+
+            now = monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, _, callback, args = heapq.heappop(self._timers)
+                self._run(callback, *args)
+
+
+    def _notification_handler(self) -> None:
+        while True:
+            callback, args = self._notifications.get()
+            self._run(callback, *args)
+
+
+
+class SerialHandler(SimpleEventDispatcher):
+    def __init__(self, serial_path: str, msg_start: int, device_name: str, magic_value: int):
+        super().__init__()
         self._serial_path = serial_path
         self._message_start = msg_start
         self._device_name = device_name
+
         self._serial = None
+        self._stream = None
+        self._fd = None
+        self._shutdown = False
+
+        self._parser = MozaFrameParser(msg_start, magic_value)
+        self._lanes = [WriteLane() for _ in WRITE_LANE_NAMES]
+        self._outgoing = memoryview(b"")
+        self._outq = array("i", [0])
+        self._write_retry = False
+        self._write_lock = Lock()
+
+        self._coalesced: dict[tuple, bytes] = {}
+        self._last_flush: dict[tuple, float] = {}
+        self.coalesced_dropped = 0
 
-        Thread(target=self._notification_handler, daemon=True).start()
-        Process(target=self._thread_spawner, daemon=True).start()
+        self._recorder = None
+        self._record_id = 0
+        self._stats = array("Q", [0]) * len(SERIAL_STAT_NAMES)
+
+        self._loop = SerialEventLoop.instance()
+        self._loop.call_soon(self._loop.attach, self)
+        self._loop.call_soon(self._serial_loader)
 
 
     def stop(self):
-        self._serial_available.clear()
-        self._shutdown.set()
+        self._loop.call_soon(self._stop)
+
+
+    def set_recorder(self, recorder) -> None:
+        """
+        Log raw TX/RX data to a SerialRecorder, None to stop
+        """
+        if recorder is not None:
+            self._record_id = recorder.register(self._device_name)
+        self._recorder = recorder
+
+
+    @property
+    def write_queue_depth(self) -> int:
+        return sum(lane.bytes for lane in self._lanes) + len(self._outgoing)
+
+
+    def lane_stats(self) -> dict[str, dict]:
+        with self._write_lock:
+            return {name: lane.stats() for name, lane in zip(WRITE_LANE_NAMES, self._lanes)}
+
+
+    def serial_stats(self) -> dict[str, int]:
+        """
+        Frame and byte counters since the handler was created
+        """
+        stats = dict(zip(SERIAL_STAT_NAMES, self._stats))
+        stats["checksum-errors"] = self._parser.checksum_errors
+        stats["bytes-dropped"] = self._parser.bytes_dropped
+        stats["coalesced-dropped"] = self.coalesced_dropped
+        return stats
+
+
+    def _update_high_water(self) -> None:
+        depth = self.write_queue_depth
+        if depth > self._stats[SERIAL_STAT_QUEUE_HIGH_WATER]:
+            self._stats[SERIAL_STAT_QUEUE_HIGH_WATER] = depth
 
 
-    def write_bytes(self, message: bytes):
+    @staticmethod
+    def _frame_count(message: bytes) -> int:
+        """
+        Frames chained in one message, every frame starts with its length
+        """
+        frames = 0
+        i = 0
+        while i + 1 < len(message):
+            i += message[i + 1] + FRAME_OVERHEAD
+            frames += 1
+        return frames
+
+
+    @property
+    def coalesced_depth(self) -> int:
+        return len(self._coalesced)
+
+
+    def write_bytes(self, message: bytes, keys=(), lane=WRITE_LANE_INTERACTIVE):
+        """
+        Keys are the coalescing slots this message supersedes.
+        Lower lanes are always sent first, safety frames preempt
+        everything that hasn't reached the kernel yet.
+        Coalesced writes issued earlier are queued before this message.
+        """
         if message is None:
             return
-        self._write_queue.put(message)
 
+        with self._write_lock:
+            self._discard_coalesced(keys)
+            pending = self._write_pending()
+            self._queue_coalesced()
+            self._lanes[lane].push(message)
+            self._update_high_water()
 
-    def _notification_handler(self):
-        while not self._shutdown.is_set():
-            try:
-                response = self._read_queue.get(timeout=0.3)
-            except:
-                continue
-            self._dispatch(response)
+        if not pending or lane == WRITE_LANE_SAFETY:
+            self._loop.call_soon(self._serial_write_handler)
 
 
-    def _serial_loader(self) -> None:
-        self._serial_available.clear()
-        self._serial = None
+    def discard_coalesced(self, keys) -> None:
+        with self._write_lock:
+            self._discard_coalesced(keys)
 
-        while self._serial is None and not self._shutdown.is_set():
-            try:
-                self._serial = Serial(self._serial_path, baudrate=115200, exclusive=False, timeout=0.5)
-                # print(f"Serial connection established for {self._device_name}")
-            except:
-                self._serial = None
-                sleep(0.2)
 
-        self._serial_available.set()
+    def _discard_coalesced(self, keys) -> None:
+        for key in keys:
+            message = self._coalesced.pop(key, None)
+            if message is not None:
+                tracing.unbind(message, self)
+                self.coalesced_dropped += 1
+
 
+    def _queue_coalesced(self) -> None:
+        """
+        Move every coalesced write to its lane right away, in the order they came in
+        """
+        if not self._coalesced:
+            return
 
-    def _thread_spawner(self) -> None:
-        self._serial_loader()
+        now = monotonic()
+        for key, message in self._coalesced.items():
+            self._lanes[WRITE_LANE_INTERACTIVE].push(message)
+            self._last_flush[key] = now
+        self._coalesced.clear()
 
-        print(f"\"{self._device_name}\" connected")
-        self._serial.reset_output_buffer()
-        self._serial.reset_input_buffer()
 
-        p1 = Thread(target=self._serial_read_handler, daemon=True, name="serial-read")
-        p2 = Thread(target=self._serial_write_handler, daemon=True, name="serial-write")
+    def write_coalesced(self, key: tuple, message: bytes, interval: float):
+        """
+        Last value wins. Only the newest message is kept per key
+        and the key is flushed at most once per interval.
+        """
+        if message is None:
+            return
+
+        with self._write_lock:
+            pending = key in self._coalesced
+            if pending:
+                tracing.unbind(self._coalesced[key], self)
+                self.coalesced_dropped += 1
+            self._coalesced[key] = message
+
+        if not pending:
+            self._loop.call_soon(self._flush_coalesced, key, interval)
+
+
+    def _flush_coalesced(self, key: tuple, interval: float) -> None:
+        now = monotonic()
+        delay = self._last_flush.get(key, 0) + interval - now
+        if delay > 0:
+            self._loop.call_later(delay, self._flush_coalesced, key, interval)
+            return
+
+        with self._write_lock:
+            message = self._coalesced.pop(key, None)
+            if message is None:
+                return
+            self._lanes[WRITE_LANE_INTERACTIVE].push(message)
+            self._update_high_water()
+
+        self._last_flush[key] = now
+        self._serial_write_handler()
 
-        p1.start()
-        p2.start()
 
-        p1.join()
-        p2.join()
+    def _stop(self) -> None:
+        self._shutdown = True
+        self._close()
+        self._loop.detach(self)
+
+        with self._write_lock:
+            for lane in self._lanes:
+                for message, _ in lane.queue:
+                    tracing.unbind(message, self)
+                lane.clear()
+            self._outgoing = memoryview(b"")
+            for message in self._coalesced.values():
+                tracing.unbind(message, self)
+            self._coalesced.clear()
+
+
+    def _serial_loader(self) -> None:
+        if self._shutdown or self._fd is not None:
+            return
 
+        try:
+            self._serial = Serial(self._serial_path, baudrate=115200, exclusive=False, timeout=0)
+            self._serial.reset_output_buffer()
+            self._serial.reset_input_buffer()
+            self._fd = self._serial.fileno()
+            os.set_blocking(self._fd, False)
+            self._stream = io.FileIO(self._fd, "rb", closefd=False)
+        except:
+            self._serial = None
+            self._stream = None
+            self._fd = None
+            self._loop.call_later(SERIAL_RECONNECT_DELAY, self._serial_loader)
+            return
+
+        print(f"\"{self._device_name}\" connected")
+        self._parser.reset()
+        self._loop.register(self._fd, selectors.EVENT_READ, self._handle_events)
+        self._serial_write_handler()
+
+
+    def _close(self) -> None:
+        if self._fd is None:
+            return
+
+        self._loop.unregister(self._fd)
         try:
             self._serial.close()
         except:
             pass
+
+        self._serial = None
+        self._stream = None
+        self._fd = None
         print(f"\"{self._device_name}\" disconnected")
 
 
-    def _serial_read_handler(self):
-        start = bytes([self._message_start])
+    def _reconnect(self) -> None:
+        self._close()
+        if not self._shutdown:
+            self._loop.call_later(SERIAL_RECONNECT_DELAY, self._serial_loader)
 
-        while not self._shutdown.is_set():
-            if not self._serial_available.wait(timeout=0.1):
-                continue
 
-            try:
-                if self._serial.read(1) != start:
-                    continue
+    def _handle_events(self, mask: int) -> None:
+        if mask & selectors.EVENT_READ:
+            self._serial_read_handler()
 
-                payload_length = int().from_bytes(self._serial.read(1))
-                if not 2 <= payload_length <= 11:
-                    continue
+        if mask & selectors.EVENT_WRITE and self._fd is not None:
+            self._serial_write_handler()
 
-                self._read_queue.put(self._serial.read(payload_length + 2))
 
-            except:
-                pass
+    def _serial_read_handler(self) -> None:
+        # With VMIN=0 an empty read only means "no more data", unless
+        # the port was reported readable and nothing came through at all
+        received = False
+        try:
+            while True:
+                start = tracing.now()
+                space = self._parser.free_space
+                count = self._parser.fill(self._stream)
+                if not count:
+                    if count == 0 and not received:
+                        raise OSError("Serial device closed")
+                    break
 
+                received = True
+                if self._recorder is not None:
+                    self._recorder.record_rx(self._record_id, self._parser.filled(count))
 
-    def _serial_write_handler(self):
-        data = None
-        while not self._shutdown.is_set():
-            try:
-                data = self._write_queue.get(timeout=0.3)
-            except:
-                continue
+                frames = self._parser.frames()
+                self._stats[SERIAL_STAT_RX_BYTES] += count
+                self._stats[SERIAL_STAT_RX_FRAMES] += len(frames)
+                for frame in frames:
+                    self._loop.notify(self._dispatch, frame)
+                tracing.span("serial-read", start, device=self._device_name, bytes=count, frames=len(frames))
+
+                if count < space:
+                    break
+
+        except OSError:
+            self._reconnect()
+
+
+    def _write_pending(self) -> bool:
+        if len(self._outgoing) > 0:
+            return True
+
+        for lane in self._lanes:
+            if lane.queue:
+                return True
+        return False
+
+
+    def _next_message(self, safety_only: bool) -> bytes:
+        lanes = self._lanes[:WRITE_LANE_SAFETY+1] if safety_only else self._lanes
+        for lane in lanes:
+            if lane.queue:
+                return lane.pop()
+        return None
 
-            # print(f"{self._device_name} writing: {data.hex(":")}")
+
+    def _output_queue_full(self) -> bool:
+        try:
+            fcntl.ioctl(self._fd, termios.TIOCOUTQ, self._outq)
+        except OSError:
+            return False
+        return self._outq[0] > SERIAL_OUTQ_LIMIT
+
+
+    def _retry_write(self) -> None:
+        self._write_retry = False
+        self._serial_write_handler()
+
+
+    def _serial_write_handler(self) -> None:
+        if self._fd is None:
+            return
+
+        with self._write_lock:
+            written = 0
+            next_check = 0
+            safety_only = False
+            flows = ()
             try:
-                self._serial.write(data)
-            except:
-                self._serial_loader()
+                while True:
+                    if len(self._outgoing) == 0:
+                        if written >= next_check:
+                            safety_only = self._output_queue_full()
+                            next_check = written + SERIAL_OUTQ_LIMIT
+
+                        message = self._next_message(safety_only)
+
+                        if message is None:
+                            if safety_only and not self._write_retry and self._write_pending():
+                                self._write_retry = True
+                                self._loop.call_later(SERIAL_OUTQ_RETRY, self._retry_write)
+                            break
+
+                        self._outgoing = memoryview(message)
+                        self._stats[SERIAL_STAT_TX_FRAMES] += self._frame_count(message)
+                        flows = tracing.unbind(message, self)
+
+                    start = tracing.now()
+
+                    # print(f"{self._device_name} writing: {self._outgoing.hex(":")}")
+                    sent = os.write(self._fd, self._outgoing)
+                    if self._recorder is not None:
+                        self._recorder.record_tx(self._record_id, self._outgoing[:sent])
+
+                    self._outgoing = self._outgoing[sent:]
+                    self._stats[SERIAL_STAT_TX_BYTES] += sent
+                    written += sent
+
+                    for flow in flows:
+                        tracing.span("serial-write", start, flow, flow_in=True, flow_out=True, device=self._device_name)
+                    flows = ()
+
+                    if len(self._outgoing) > 0:
+                        break
+
+            except BlockingIOError:
+                pass
+            except OSError:
+                self._reconnect()
+                return
+
+            events = selectors.EVENT_READ
+            if len(self._outgoing) > 0:
+                events |= selectors.EVENT_WRITE
+
+        self._loop.modify(self._fd, events, self._handle_events)
@@ -0,0 +1,217 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+"""
+Binary log of everything that goes over the serial ports.
+
+File layout: RECORD_MAGIC, then records of RECORD_HEADER
+(timestamp, direction, device index, data length) followed by the data.
+Device names are stored once as RECORD_DEVICE records.
+
+python -m boxflat.serial_recorder capture.bfr [--fast] [--reference]
+"""
+
+import os
+import yaml
+import struct
+import argparse
+from threading import Lock
+from time import monotonic, sleep
+from .serial_handler import SerialEventLoop, MozaFrameParser
+from .moza_command import MozaCommand, MozaResponseDecoder
+
+RECORD_MAGIC = b"BXFR\x01"
+RECORD_HEADER = struct.Struct("<dBBH")
+
+RECORD_TX = 0
+RECORD_RX = 1
+RECORD_DEVICE = 2
+
+RECORD_BUFFER_SIZE = 65536
+RECORD_FLUSH_INTERVAL = 1.0
+
+
+class SerialRecorder():
+    """
+    Appends raw TX/RX data of every serial device to a log file.
+    Records land in a preallocated buffer which is written out
+    when full or every RECORD_FLUSH_INTERVAL seconds.
+    """
+    def __init__(self, log_path: str, buffer_size=RECORD_BUFFER_SIZE):
+        self._file = open(os.path.expanduser(log_path), "wb")
+        self._file.write(RECORD_MAGIC)
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._used = 0
+        self._start = monotonic()
+        self._devices: dict[str, int] = {}
+        self._lock = Lock()
+        self.records = 0
+
+        self._loop = SerialEventLoop.instance()
+        self._loop.call_soon(self._loop.call_later, RECORD_FLUSH_INTERVAL, self._periodic_flush)
+
+
+    def register(self, device_name: str) -> int:
+        with self._lock:
+            if device_name not in self._devices:
+                self._devices[device_name] = len(self._devices)
+                self._append(self._devices[device_name], RECORD_DEVICE, device_name.encode())
+            return self._devices[device_name]
+
+
+    def record_tx(self, device: int, data) -> None:
+        with self._lock:
+            self._append(device, RECORD_TX, data)
+
+
+    def record_rx(self, device: int, data) -> None:
+        with self._lock:
+            self._append(device, RECORD_RX, data)
+
+
+    def _append(self, device: int, direction: int, data) -> None:
+        if self._file is None:
+            return
+
+        size = RECORD_HEADER.size + len(data)
+        if self._used + size > len(self._buffer):
+            self._flush()
+
+            # Bigger than the whole buffer, write it out directly
+            if size > len(self._buffer):
+                self._file.write(RECORD_HEADER.pack(monotonic() - self._start, direction, device, len(data)))
+                self._file.write(data)
+                self.records += 1
+                return
+
+        RECORD_HEADER.pack_into(self._buffer, self._used, monotonic() - self._start, direction, device, len(data))
+        self._used += RECORD_HEADER.size
+        self._buffer[self._used:self._used + len(data)] = data
+        self._used += len(data)
+        self.records += 1
+
+
+    def _flush(self) -> None:
+        if self._used == 0 or self._file is None:
+            return
+
+        self._file.write(self._view[:self._used])
+        self._file.flush()
+        self._used = 0
+
+
+    def _periodic_flush(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+
+        self._loop.call_later(RECORD_FLUSH_INTERVAL, self._periodic_flush)
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+
+def read_log(log_path: str):
+    """
+    Yields timestamp, direction, device name and data of every record
+    """
+    devices: dict[int, str] = {}
+    with open(os.path.expanduser(log_path), "rb") as stream:
+        if stream.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError(f"Not a boxflat serial log: {log_path}")
+
+        while True:
+            header = stream.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            timestamp, direction, device, length = RECORD_HEADER.unpack(header)
+            data = stream.read(length)
+            if len(data) < length:
+                return
+
+            if direction == RECORD_DEVICE:
+                devices[device] = data.decode()
+                continue
+
+            yield timestamp, direction, devices.get(device, str(device)), data
+
+
+
+def replay(log_path: str, serial_data: dict, realtime=True, reference=False, callback=None) -> dict:
+    """
+    Feeds recorded RX data through the frame parser and response decoder,
+    either at the original pace or as fast as possible.
+    Returns frame and decode counts.
+    """
+    message_start = int(serial_data["message-start"])
+    magic_value = int(serial_data["magic-value"])
+    commands = serial_data["commands"]
+    device_ids = serial_data["ids-to-names"]
+    decoder = MozaResponseDecoder(commands, device_ids)
+
+    parsers: dict[str, MozaFrameParser] = {}
+    stats = {"tx-bytes": 0, "rx-bytes": 0, "frames": 0, "decoded": 0, "checksum-errors": 0}
+    start = monotonic()
+
+    for timestamp, direction, device_name, data in read_log(log_path):
+        if realtime:
+            delay = timestamp - (monotonic() - start)
+            if delay > 0:
+                sleep(delay)
+
+        if direction == RECORD_TX:
+            stats["tx-bytes"] += len(data)
+            continue
+
+        stats["rx-bytes"] += len(data)
+        parser = parsers.get(device_name)
+        if parser is None:
+            parser = MozaFrameParser(message_start, magic_value)
+            parsers[device_name] = parser
+
+        parser.feed(data)
+        for frame in parser.frames():
+            stats["frames"] += 1
+            if reference:
+                command, value = MozaCommand.value_from_response(frame, device_name, commands, device_ids)
+            else:
+                command, value = decoder.decode(frame, device_name)
+
+            if value is None:
+                continue
+
+            stats["decoded"] += 1
+            if callback is not None:
+                callback(timestamp, device_name, command, value)
+
+    stats["checksum-errors"] = sum(parser.checksum_errors for parser in parsers.values())
+    stats["duration"] = monotonic() - start
+    return stats
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("boxflat.serial_recorder")
+    parser.add_argument("log", help="Recorded serial log", type=str)
+    parser.add_argument("--data-path", help="Boxflat data path", type=str, default="data")
+    parser.add_argument("--fast", help="Replay as fast as possible", action="store_true")
+    parser.add_argument("--reference", help="Decode with MozaCommand.value_from_response", action="store_true")
+    parser.add_argument("--verbose", help="Print every decoded value", action="store_true")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.data_path, "serial.yml")) as stream:
+        serial_data = yaml.safe_load(stream)
+
+    printer = None
+    if args.verbose:
+        printer = lambda timestamp, device, command, value: print(f"{timestamp:10.4f} {device}: {command} = {value}")
+
+    print(replay(args.log, serial_data, not args.fast, args.reference, printer))
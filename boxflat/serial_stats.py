@@ -0,0 +1,123 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import yaml
+from array import array
+from bisect import bisect_left
+from threading import Lock
+
+# Upper bounds of the round trip buckets in seconds, anything slower lands in the last one
+STATS_RTT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2)
+STATS_RTT_LABELS = tuple(f"<{bound * 1000:g}ms" for bound in STATS_RTT_BUCKETS) + (f">{STATS_RTT_BUCKETS[-1] * 1000:g}ms",)
+
+
+class RoundTripStats():
+    """
+    Read round trip histograms and timeout counters of every command.
+    Everything lives in arrays allocated once for the whole command list,
+    so recording is a dict lookup, a bisect and a few increments.
+    """
+    def __init__(self, command_names: list[str]):
+        self._names = list(command_names)
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._buckets = len(STATS_RTT_LABELS)
+
+        size = len(self._names)
+        self._histogram = array("L", [0]) * (size * self._buckets)
+        self._responses = array("L", [0]) * size
+        self._timeouts = array("L", [0]) * size
+        self._rtt_total = array("d", [0.0]) * size
+        self._rtt_max = array("d", [0.0]) * size
+        self._lock = Lock()
+
+
+    def record_rtt(self, command_name: str, rtt: float) -> None:
+        i = self._index.get(command_name)
+        if i is None:
+            return
+
+        bucket = bisect_left(STATS_RTT_BUCKETS, rtt)
+        with self._lock:
+            self._histogram[i * self._buckets + bucket] += 1
+            self._responses[i] += 1
+            self._rtt_total[i] += rtt
+            if rtt > self._rtt_max[i]:
+                self._rtt_max[i] = rtt
+
+
+    def record_timeout(self, command_name: str) -> None:
+        i = self._index.get(command_name)
+        if i is None:
+            return
+
+        with self._lock:
+            self._timeouts[i] += 1
+
+
+    def reset(self) -> None:
+        with self._lock:
+            for counters in (self._histogram, self._responses, self._timeouts, self._rtt_total, self._rtt_max):
+                counters[:] = array(counters.typecode, [0]) * len(counters)
+
+
+    def _percentile(self, histogram: list[int], responses: int, fraction: float) -> str:
+        """
+        Bucket the given fraction of responses falls into
+        """
+        needed = responses * fraction
+        seen = 0
+        for label, count in zip(STATS_RTT_LABELS, histogram):
+            seen += count
+            if seen >= needed:
+                return label
+        return STATS_RTT_LABELS[-1]
+
+
+    def snapshot(self) -> dict[str, dict[str, dict]]:
+        """
+        Per device: stats of every command that was read at least once
+        """
+        with self._lock:
+            histogram = self._histogram.tolist()
+            responses = self._responses.tolist()
+            timeouts = self._timeouts.tolist()
+            rtt_total = self._rtt_total.tolist()
+            rtt_max = self._rtt_max.tolist()
+
+        devices = {}
+        for i, command_name in enumerate(self._names):
+            if responses[i] == 0 and timeouts[i] == 0:
+                continue
+
+            buckets = histogram[i * self._buckets:(i + 1) * self._buckets]
+            stats = {
+                "responses" : responses[i],
+                "timeouts"  : timeouts[i],
+                "avg-ms"    : round(rtt_total[i] / responses[i] * 1000, 3) if responses[i] else None,
+                "max-ms"    : round(rtt_max[i] * 1000, 3),
+                "p50"       : self._percentile(buckets, responses[i], 0.5) if responses[i] else None,
+                "p99"       : self._percentile(buckets, responses[i], 0.99) if responses[i] else None,
+                "histogram" : {label: count for label, count in zip(STATS_RTT_LABELS, buckets) if count},
+            }
+
+            device_name, name = command_name.split("-", maxsplit=1)
+            devices.setdefault(device_name, {})[name] = stats
+
+        return devices
+
+
+
+def dump_stats(stats: dict, output_path: str=None) -> None:
+    """
+    Write a stats snapshot as YAML, to stdout without a path
+    """
+    text = yaml.safe_dump(stats, sort_keys=False)
+    if not output_path or output_path == "-":
+        print(text)
+        return
+
+    try:
+        with open(os.path.expanduser(output_path), "w") as stream:
+            stream.write(text)
+    except OSError as error:
+        print(f"Can't write serial stats: {error}")
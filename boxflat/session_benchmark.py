@@ -0,0 +1,97 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+"""
+Multi-device throughput while one device is inside sessions.
+
+Runs against boxflat.simulator: plain reads of the base and pedals are
+counted alone, then again while another thread loops dash sessions
+(read the indicator mode, switch it, switch it back).
+
+python -m boxflat.session_benchmark [--duration 2] [--latency 0.002]
+"""
+
+import os
+import tempfile
+import argparse
+from threading import Thread, Event
+from time import monotonic, sleep
+from .simulator import MozaSimulator
+from .connection_manager import MozaConnectionManager
+
+BENCH_READS = {
+    "base"   : "base-limit",
+    "pedals" : "pedals-throttle-dir",
+}
+BENCH_SESSION_DEVICE = "dash"
+BENCH_SESSION_COMMAND = "dash-rpm-indicator-mode"
+BENCH_CONNECT_DELAY = 0.5
+
+
+def _reader(cm: MozaConnectionManager, command_name: str, stop: Event, counts: dict, name: str) -> None:
+    while not stop.is_set():
+        if cm.get_setting(command_name) is not None:
+            counts[name] += 1
+
+
+def _sessions(cm: MozaConnectionManager, stop: Event, counts: dict) -> None:
+    while not stop.is_set():
+        with cm.session(BENCH_SESSION_DEVICE) as session:
+            mode = session.get_setting(BENCH_SESSION_COMMAND)
+            session.set_setting(1, BENCH_SESSION_COMMAND)
+            session.set_setting(mode or 0, BENCH_SESSION_COMMAND)
+        counts[BENCH_SESSION_DEVICE] += 1
+
+
+def run_phase(cm: MozaConnectionManager, duration: float, with_sessions: bool) -> dict[str, float]:
+    """
+    Operations per second of every device
+    """
+    stop = Event()
+    counts = dict.fromkeys(BENCH_READS, 0)
+    threads = [Thread(target=_reader, args=(cm, command, stop, counts, name), daemon=True)
+        for name, command in BENCH_READS.items()]
+
+    if with_sessions:
+        counts[BENCH_SESSION_DEVICE] = 0
+        threads.append(Thread(target=_sessions, args=(cm, stop, counts), daemon=True))
+
+    start = monotonic()
+    for thread in threads:
+        thread.start()
+
+    sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    elapsed = monotonic() - start
+    return {name: count / elapsed for name, count in counts.items()}
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("boxflat.session_benchmark")
+    parser.add_argument("--data-path", help="Boxflat data path", type=str, default="data")
+    parser.add_argument("--duration", help="Seconds per phase", type=float, default=2.0)
+    parser.add_argument("--latency", help="Simulated response latency in seconds", type=float, default=0.002)
+    args = parser.parse_args()
+
+    serial_data_path = os.path.join(args.data_path, "serial.yml")
+    directory = tempfile.mkdtemp(prefix="boxflat-bench-")
+
+    simulator = MozaSimulator(serial_data_path, directory, latency=args.latency)
+    simulator.start()
+
+    cm = MozaConnectionManager(serial_data_path, serial_path=directory)
+    cm.device_discovery()
+    sleep(BENCH_CONNECT_DELAY)
+
+    alone = run_phase(cm, args.duration, False)
+    shared = run_phase(cm, args.duration, True)
+
+    for name in BENCH_READS:
+        print(f"{name:>8}: {alone[name]:8.1f} reads/s alone, {shared[name]:8.1f} with {BENCH_SESSION_DEVICE} sessions")
+    print(f"{BENCH_SESSION_DEVICE:>8}: {shared[BENCH_SESSION_DEVICE]:8.1f} sessions/s")
+
+    cm.shutdown()
+    simulator.stop()
@@ -0,0 +1,85 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+from threading import Condition, get_ident
+
+
+class SessionGate():
+    """
+    Exclusive access to one device. Reentrant for the thread holding it,
+    everyone else waits until the session ends.
+    """
+    def __init__(self):
+        self._condition = Condition()
+        self._owner = None
+        self._depth = 0
+
+
+    def acquire(self) -> None:
+        me = get_ident()
+        with self._condition:
+            while self._owner not in (None, me):
+                self._condition.wait()
+            self._owner = me
+            self._depth += 1
+
+
+    def release(self) -> None:
+        with self._condition:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+
+    def owned(self) -> bool:
+        return self._owner == get_ident()
+
+
+    def busy(self) -> bool:
+        """
+        Another thread holds a session on this device
+        """
+        owner = self._owner
+        return owner is not None and owner != get_ident()
+
+
+    def wait(self) -> None:
+        """
+        Block while another thread holds a session on this device
+        """
+        owner = self._owner
+        if owner is None or owner == get_ident():
+            return
+
+        with self._condition:
+            while self._owner not in (None, get_ident()):
+                self._condition.wait()
+
+
+
+class DeviceSession():
+    """
+    Handle returned by MozaConnectionManager.session().
+    Frames go out in the order they were issued, single settings and
+    batches alike share one lane, nothing is coalesced and no other
+    thread can talk to this device in between.
+    """
+    def __init__(self, connection_manager, device_name: str):
+        self._cm = connection_manager
+        self.device_name = device_name
+
+
+    def set_setting(self, value, command_name: str) -> None:
+        self._cm.set_setting(value, command_name, exclusive=True)
+
+
+    def get_setting(self, command_name: str, custom_value=1, **kwargs):
+        return self._cm.get_setting(command_name, exclusive=True, custom_value=custom_value, **kwargs)
+
+
+    def set_settings(self, settings: dict, **kwargs) -> dict:
+        return self._cm.set_settings(settings, **kwargs)
+
+
+    def get_settings(self, command_names: list[str], **kwargs) -> dict:
+        return self._cm.get_settings(command_names, **kwargs)
@@ -0,0 +1,93 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+from threading import Lock
+from time import monotonic
+
+
+class ShadowRegister():
+    __slots__ = ("value", "raw", "timestamp", "valid")
+
+    def __init__(self, value, raw: bytes):
+        self.value = value
+        self.raw = raw
+        self.timestamp = monotonic()
+        self.valid = True
+
+
+    @property
+    def age(self) -> float:
+        return monotonic() - self.timestamp
+
+
+
+class ShadowRegisters():
+    """
+    Last known device value of every command, fed by read
+    responses and acknowledged writes.
+    """
+    def __init__(self):
+        self._registers: dict[str, ShadowRegister] = {}
+        self._lock = Lock()
+
+
+    def update(self, command_name: str, value, raw: bytes) -> None:
+        register = ShadowRegister(value, raw)
+        with self._lock:
+            self._registers[command_name] = register
+
+
+    def get(self, command_name: str, max_age: float=None) -> ShadowRegister:
+        register = self._registers.get(command_name)
+        if register is None or not register.valid:
+            return None
+
+        if max_age is not None and register.age > max_age:
+            return None
+
+        return register
+
+
+    def get_value(self, command_name: str, max_age: float=None):
+        register = self.get(command_name, max_age)
+        if register is None:
+            return None
+        return register.value
+
+
+    def matches(self, command_name: str, raw: bytes, max_age: float=None) -> bool:
+        register = self.get(command_name, max_age)
+        if register is None:
+            return False
+        return register.raw == raw
+
+
+    def invalidate(self, command_name: str) -> None:
+        register = self._registers.get(command_name)
+        if register is not None:
+            register.valid = False
+
+
+    def invalidate_device(self, device_name: str) -> None:
+        prefix = f"{device_name}-"
+        with self._lock:
+            for command_name, register in self._registers.items():
+                if command_name.startswith(prefix):
+                    register.valid = False
+
+
+    def values(self, device_name: str) -> dict:
+        """
+        Every valid value of one device
+        """
+        prefix = f"{device_name}-"
+        with self._lock:
+            return {
+                command_name: register.value
+                for command_name, register in self._registers.items()
+                if register.valid and command_name.startswith(prefix)
+            }
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._registers.clear()
@@ -0,0 +1,271 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+"""
+Pseudo-terminal stand-in for Moza hardware.
+
+Every simulated port is a pty with a by-id style symlink pointing at it,
+so boxflat can be started with --serial-path pointed at the simulator directory.
+Writes are mirrored back as responses and remembered as register state,
+reads answer with the last written value.
+
+python -m boxflat.simulator --path /tmp/moza-sim --latency 0.002 --loss 0.01
+"""
+
+import os
+import pty
+import tty
+import heapq
+import yaml
+import random
+import select
+import argparse
+from collections import deque
+from threading import Thread, Event
+from time import monotonic, sleep
+from .bitwise import swap_nibbles
+from .serial_handler import MozaFrameParser
+
+SIM_DEFAULT_PORTS = {
+    "base"   : ("usb-Gudsen_Moza_R9_Base_SIM0001-if00", ("base", "wheel", "dash")),
+    "pedals" : ("usb-Gudsen_Moza_SRP_Pedals_SIM0002-if00", ("pedals",)),
+    "hub"    : ("usb-Gudsen_Universal_Hub_SIM0003-if00", ("hub",)),
+}
+
+SIM_RESPONSE_BIT = 0x80
+SIM_READ_SIZE = 4096
+SIM_HISTORY_LENGTH = 1024
+
+
+class SimulatedCommand():
+    __slots__ = ("name", "length")
+
+    def __init__(self, name: str, length: int):
+        self.name = name
+        self.length = length
+
+
+
+class SimulatedPort():
+    """
+    One serial device. Answers for its own device (on the "main" id too)
+    and every device reachable through it.
+    """
+    def __init__(self, name: str, link: str, devices: tuple, serial_data: dict,
+                 registers: dict, latency=0.002, jitter=0.0, loss=0.0, seed=None):
+        self.name = name
+        self.link = link
+        self.frames_received = 0
+        self.frames_answered = 0
+        self.frames_lost = 0
+        self.frames_unknown = 0
+
+        # (command, write) of every known frame in the order it came in
+        self.history: deque[tuple[str, bool]] = deque(maxlen=SIM_HISTORY_LENGTH)
+
+        self._start = int(serial_data["message-start"])
+        self._magic = int(serial_data["magic-value"])
+        self._latency = latency
+        self._jitter = jitter
+        self._loss = loss
+        self._random = random.Random(seed)
+        self._registers = registers
+
+        self._parser = MozaFrameParser(self._start, self._magic)
+        self._responses = []
+        self._shutdown = Event()
+        self._master = None
+        self._slave = None
+
+        device_ids = serial_data["device-ids"]
+        self._commands: dict[int, dict[tuple[int, bytes], tuple[SimulatedCommand, bool]]] = {}
+        self._id_lengths = set()
+
+        for device in devices:
+            device_id = device_ids[device]
+            self._add_commands(device_id, device, serial_data["commands"].get(device, {}))
+
+        # Directly connected devices are addressed with the main id
+        main_id = device_ids["main"]
+        self._add_commands(main_id, name, serial_data["commands"].get(name, {}))
+        self._add_commands(main_id, "main", serial_data["commands"].get("main", {}))
+        self._id_lengths = sorted(self._id_lengths)
+
+
+    def _add_commands(self, device_id: int, device: str, commands: dict) -> None:
+        lookup = self._commands.setdefault(device_id, {})
+        for command_name, data in commands.items():
+            command_id = bytes(data["id"])
+            command = SimulatedCommand(f"{device}-{command_name}", int(data["bytes"]))
+            self._id_lengths.add(len(command_id))
+
+            for group, write in ((int(data["read"]), False), (int(data["write"]), True)):
+                if group != -1:
+                    lookup.setdefault((group, command_id), (command, write))
+
+
+    def start(self) -> None:
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+
+        if os.path.lexists(self.link):
+            os.remove(self.link)
+        os.symlink(os.ttyname(self._slave), self.link)
+
+        Thread(target=self._run, daemon=True, name=f"sim-{self.name}").start()
+
+
+    def stop(self) -> None:
+        self._shutdown.set()
+        if os.path.lexists(self.link):
+            os.remove(self.link)
+
+
+    def _run(self) -> None:
+        while not self._shutdown.is_set():
+            timeout = 0.1
+            if self._responses:
+                timeout = max(0, self._responses[0][0] - monotonic())
+
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                try:
+                    self._parser.feed(os.read(self._master, SIM_READ_SIZE))
+                except OSError:
+                    pass
+
+                for frame in self._parser.frames():
+                    self._handle_frame(frame)
+
+            now = monotonic()
+            while self._responses and self._responses[0][0] <= now:
+                _, _, response = heapq.heappop(self._responses)
+                try:
+                    os.write(self._master, response)
+                except OSError:
+                    pass
+
+        os.close(self._master)
+        os.close(self._slave)
+
+
+    def _find_command(self, device_id: int, group: int, body: bytes) -> tuple[SimulatedCommand, bytes, bool]:
+        lookup = self._commands.get(device_id)
+        if lookup is None:
+            return None, b"", False
+
+        for length in self._id_lengths:
+            command_id = body[:length]
+            entry = lookup.get((group, command_id))
+            if entry is not None:
+                return entry[0], command_id, entry[1]
+
+        return None, b"", False
+
+
+    def _handle_frame(self, frame: bytes) -> None:
+        self.frames_received += 1
+        group, device_id, body = frame[0], frame[1], frame[2:]
+
+        command, command_id, write = self._find_command(device_id, group, body)
+        if command is None:
+            self.frames_unknown += 1
+            return
+
+        self.history.append((command.name, write))
+        payload = body[len(command_id):]
+        if write:
+            self._registers[command.name] = payload
+        else:
+            payload = self._registers.get(command.name, 0)
+            if isinstance(payload, int):
+                payload = payload.to_bytes(command.length)
+
+        if self._random.random() < self._loss:
+            self.frames_lost += 1
+            return
+
+        response = bytearray((self._start, len(command_id) + len(payload),
+            group | SIM_RESPONSE_BIT, swap_nibbles(device_id)))
+        response.extend(command_id)
+        response.extend(payload)
+        response.append((self._magic + sum(response)) % 256)
+
+        delay = self._latency + self._random.uniform(0, self._jitter)
+        heapq.heappush(self._responses, (monotonic() + delay, self.frames_answered, bytes(response)))
+        self.frames_answered += 1
+
+
+
+class MozaSimulator():
+    def __init__(self, serial_data_path: str, directory: str, ports=SIM_DEFAULT_PORTS,
+                 latency=0.002, jitter=0.0, loss=0.0, seed=None, registers: dict=None):
+        with open(serial_data_path) as stream:
+            serial_data = yaml.safe_load(stream)
+
+        self._directory = os.path.expanduser(directory)
+        self.registers = registers if registers is not None else {}
+        self.ports: dict[str, SimulatedPort] = {}
+
+        for name, (link, devices) in ports.items():
+            self.ports[name] = SimulatedPort(
+                name, os.path.join(self._directory, link), devices, serial_data,
+                self.registers, latency, jitter, loss, seed)
+
+
+    def start(self) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+        for port in self.ports.values():
+            port.start()
+
+
+    def stop(self) -> None:
+        for port in self.ports.values():
+            port.stop()
+
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            name: {
+                "received" : port.frames_received,
+                "answered" : port.frames_answered,
+                "lost"     : port.frames_lost,
+                "unknown"  : port.frames_unknown,
+            }
+            for name, port in self.ports.items()
+        }
+
+
+
+def _parse_register(value: str) -> tuple[str, int]:
+    name, _, number = value.partition("=")
+    return name, int(number, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("boxflat.simulator")
+    parser.add_argument("--path", help="Directory for the by-id style links", type=str, default="/tmp/boxflat-sim")
+    parser.add_argument("--data-path", help="Boxflat data path", type=str, default="data")
+    parser.add_argument("--latency", help="Response latency in seconds", type=float, default=0.002)
+    parser.add_argument("--jitter", help="Max random extra latency in seconds", type=float, default=0.0)
+    parser.add_argument("--loss", help="Probability of a response getting lost", type=float, default=0.0)
+    parser.add_argument("--seed", help="Random seed", type=int, required=False)
+    parser.add_argument("--set", help="Initial register value, e.g. hub-port1=1", action="append", default=[])
+    args = parser.parse_args()
+
+    simulator = MozaSimulator(
+        os.path.join(args.data_path, "serial.yml"), args.path,
+        latency=args.latency, jitter=args.jitter, loss=args.loss, seed=args.seed,
+        registers=dict(_parse_register(value) for value in args.set))
+    simulator.start()
+
+    for name, port in simulator.ports.items():
+        print(f"{name}: {port.link}")
+
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        print(simulator.stats())
+        simulator.stop()
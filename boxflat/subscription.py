@@ -1,7 +1,8 @@
 # Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
 
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 from queue import SimpleQueue
+from time import monotonic
 
 
 class Subscription():
@@ -273,3 +274,125 @@ class BlockingValue():
     def get_value_no_clear(self, timeout=0.05):
         self._event.wait(timeout)
         return self._value
+
+
+
+class ResponseFuture():
+    __slots__ = ("key", "_value", "_event")
+
+    def __init__(self, key):
+        self.key = key
+        self._value = None
+        self._event = Event()
+
+
+    def set_result(self, value):
+        self._value = value
+        self._event.set()
+
+
+    def done(self) -> bool:
+        return self._event.is_set()
+
+
+    def result(self, timeout=0.05):
+        self._event.wait(timeout)
+        return self._value
+
+
+
+class PendingRequests():
+    """
+    Correlates outstanding read requests with their responses.
+    Every caller gets its own future, so late responses can never
+    resolve a request that already gave up.
+
+    Callers asking for a key that already has a request on the wire
+    are attached to it instead of sending another one (single-flight).
+    """
+    def __init__(self):
+        self._pending: dict[tuple, list[ResponseFuture]] = {}
+        # Send time and expiry of the request on the wire
+        self._sent: dict[tuple, tuple[float, float]] = {}
+        self._resent: set[tuple] = set()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+    def add(self, key: tuple) -> ResponseFuture:
+        future = ResponseFuture(key)
+        with self._lock:
+            self._pending.setdefault(key, []).append(future)
+        return future
+
+
+    def request(self, key: tuple, max_age: float) -> tuple[ResponseFuture, bool]:
+        """
+        Returns a future and whether the caller has to send the request.
+        A request that has to be sent stays on the wire for max_age.
+        """
+        future = ResponseFuture(key)
+        with self._lock:
+            send = self._claim(key, max_age)
+            self._pending.setdefault(key, []).append(future)
+        return future, send
+
+
+    def _claim(self, key: tuple, max_age: float) -> bool:
+        now = monotonic()
+        sent = self._sent.get(key)
+        if sent is not None and now < sent[1]:
+            self.hits += 1
+            return False
+
+        # Sent again before an answer came, the answer could be to either one
+        if sent is not None:
+            self._resent.add(key)
+
+        self.misses += 1
+        self._sent[key] = (now, now + max_age)
+        return True
+
+
+    def resolve(self, key: tuple, value) -> float:
+        """
+        Returns how long the request took, also when everyone gave up on it already.
+        None if the request wasn't sent through request() or was sent more than once.
+        """
+        with self._lock:
+            futures = self._pending.pop(key, None)
+            sent = self._sent.pop(key, None)
+            if key in self._resent:
+                self._resent.discard(key)
+                sent = None
+
+        for future in futures or ():
+            future.set_result(value)
+
+        if sent is None:
+            return None
+        return monotonic() - sent[0]
+
+
+    def cancel(self, future: ResponseFuture) -> None:
+        with self._lock:
+            futures = self._pending.get(future.key)
+            if futures is None or future not in futures:
+                return
+
+            futures.remove(future)
+            if not futures:
+                self._pending.pop(future.key)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._sent.clear()
+            self._resent.clear()
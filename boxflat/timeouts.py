@@ -0,0 +1,119 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+from threading import Lock
+
+# Read timeout bounds and the value used until a route has been measured
+RTO_MIN=0.01
+RTO_MAX=0.25
+RTO_INITIAL=0.05
+
+# The fixed read timeout used before. Only a miss after waiting at least
+# this long counts against a command or its route, a shorter wait may just
+# have been a slow answer
+RTO_CONCLUSIVE=0.05
+
+# Smoothing gains and variance multiplier, same as TCP (RFC 6298)
+RTO_ALPHA=1/8
+RTO_BETA=1/4
+RTO_K=4
+
+# Smallest variance margin, scheduling noise on a desktop is about that big
+RTO_GRANULARITY=0.002
+
+
+class RttEstimator():
+    __slots__ = ("srtt", "rttvar", "rto", "samples", "backoffs")
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = RTO_INITIAL
+        self.samples = 0
+        self.backoffs = 0
+
+
+    def sample(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTO_BETA) * self.rttvar + RTO_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTO_ALPHA) * self.srtt + RTO_ALPHA * rtt
+
+        self.samples += 1
+        self.rto = min(max(self.srtt + max(RTO_GRANULARITY, RTO_K * self.rttvar), RTO_MIN), RTO_MAX)
+
+
+    def backoff(self) -> None:
+        """
+        Double the timeout after a miss, the next sample recomputes it
+        """
+        self.backoffs += 1
+        self.rto = min(self.rto * 2, RTO_MAX)
+
+
+
+class AdaptiveTimeouts():
+    """
+    Smoothed round trip time and its variance for every route
+    (logical device, serial port), read timeouts derived from them
+    the way TCP derives its retransmission timeout.
+    Direct USB devices end up with short timeouts, devices behind
+    a base or hub passthrough get the longer ones they need.
+    """
+    def __init__(self):
+        self._estimators: dict[tuple[str, str], RttEstimator] = {}
+        self._lock = Lock()
+
+
+    def timeout(self, device_type: str, ports: list[str]) -> float:
+        """
+        Read timeout of a device reached through these ports,
+        the slowest one counts while the route isn't known yet
+        """
+        timeout = 0.0
+        for port in ports:
+            estimator = self._estimators.get((device_type, port))
+            timeout = max(timeout, RTO_INITIAL if estimator is None else estimator.rto)
+
+        return timeout or RTO_INITIAL
+
+
+    def sample(self, device_type: str, port: str, rtt: float) -> None:
+        with self._lock:
+            estimator = self._estimators.get((device_type, port))
+            if estimator is None:
+                estimator = RttEstimator()
+                self._estimators[device_type, port] = estimator
+            estimator.sample(rtt)
+
+
+    def backoff(self, device_type: str, ports: list[str]) -> None:
+        with self._lock:
+            for port in ports:
+                estimator = self._estimators.get((device_type, port))
+                if estimator is not None:
+                    estimator.backoff()
+
+
+    def forget_port(self, port: str) -> None:
+        with self._lock:
+            for key in [key for key in self._estimators if key[1] == port]:
+                del self._estimators[key]
+
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Per route ("device@port"): smoothed RTT, variance and timeout in ms
+        """
+        with self._lock:
+            return {
+                f"{device_type}@{port}": {
+                    "srtt-ms"   : round((estimator.srtt or 0) * 1000, 3),
+                    "rttvar-ms" : round(estimator.rttvar * 1000, 3),
+                    "rto-ms"    : round(estimator.rto * 1000, 3),
+                    "samples"   : estimator.samples,
+                    "backoffs"  : estimator.backoffs,
+                }
+                for (device_type, port), estimator in self._estimators.items()
+            }
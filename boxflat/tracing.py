@@ -0,0 +1,199 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+"""
+Opt-in tracing of a setting on its way from a widget to the device and back.
+
+Spans are stored as Chrome trace events and written out on stop(),
+the file opens in chrome://tracing or ui.perfetto.dev. A widget change
+starts a flow that its write continues, frames are followed across
+threads keyed by the command (device, group, id) so a response picks
+up the flow of its request.
+
+Every helper returns right away while tracing is off.
+"""
+
+import os
+import json
+import threading
+from itertools import count
+from time import perf_counter_ns
+
+TRACE_MAX_EVENTS = 2_000_000
+TRACE_PROCESS_ID = 1
+
+tracer = None
+
+
+class Tracer():
+    def __init__(self, trace_path: str, max_events=TRACE_MAX_EVENTS):
+        self._trace_path = os.path.expanduser(trace_path)
+        self._max_events = max_events
+        self._events = []
+        self._threads = set()
+        self._flow_ids = count(1)
+        self._flows: dict[tuple, int] = {}
+        self._messages: dict[tuple[int, int], tuple[bytes, list[int]]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+
+    @staticmethod
+    def now() -> int:
+        return perf_counter_ns() // 1000
+
+
+    def _append(self, event: dict) -> None:
+        if len(self._events) >= self._max_events:
+            self.dropped += 1
+            return
+
+        tid = threading.get_ident()
+        event["pid"] = TRACE_PROCESS_ID
+        event["tid"] = tid
+
+        if tid not in self._threads:
+            self._threads.add(tid)
+            self._events.append({"name": "thread_name", "ph": "M", "pid": TRACE_PROCESS_ID,
+                "tid": tid, "args": {"name": threading.current_thread().name}})
+
+        self._events.append(event)
+
+
+    def span(self, name: str, start: int, flow: int=None, flow_in=False, flow_out=False, **args) -> None:
+        event = {"name": name, "cat": "boxflat", "ph": "X", "ts": start, "dur": self.now() - start}
+        if args:
+            event["args"] = args
+
+        if flow is not None:
+            event["bind_id"] = flow
+            event["flow_in"] = flow_in
+            event["flow_out"] = flow_out
+
+        self._append(event)
+
+
+    def flow_new(self) -> int:
+        return next(self._flow_ids)
+
+
+    def flow_start(self, key: tuple) -> int:
+        """
+        Continue the current flow of this thread or start a new one
+        """
+        flow = self.current() or next(self._flow_ids)
+        with self._lock:
+            self._flows[key] = flow
+        return flow
+
+
+    def flow_take(self, key: tuple) -> int:
+        with self._lock:
+            return self._flows.pop(key, None)
+
+
+    def bind(self, message: bytes, flows: list[int], owner) -> None:
+        """
+        Frames in message continue these flows once owner writes them out.
+        The message is kept alive until then, so its id can't be reused.
+        """
+        with self._lock:
+            self._messages[id(owner), id(message)] = (message, list(flows))
+
+
+    def unbind(self, message: bytes, owner) -> list[int]:
+        with self._lock:
+            bound = self._messages.pop((id(owner), id(message)), None)
+        return () if bound is None else bound[1]
+
+
+    def set_current(self, flow: int) -> None:
+        self._local.flow = flow
+
+
+    def current(self) -> int:
+        return getattr(self._local, "flow", None)
+
+
+    def write(self) -> None:
+        data = {"traceEvents": self._events, "displayTimeUnit": "ms"}
+        try:
+            with open(self._trace_path, "w") as stream:
+                json.dump(data, stream)
+        except OSError as error:
+            print(f"Can't write trace: {error}")
+            return
+
+        print(f"Trace written to {self._trace_path} ({len(self._events)} events, {self.dropped} dropped)")
+
+
+
+def start(trace_path: str, max_events=TRACE_MAX_EVENTS) -> None:
+    global tracer
+    tracer = Tracer(trace_path, max_events)
+
+
+def stop() -> None:
+    global tracer
+    if tracer is None:
+        return
+
+    active, tracer = tracer, None
+    active.write()
+
+
+def now() -> int:
+    if tracer is None:
+        return 0
+    return tracer.now()
+
+
+def span(name: str, start: int, flow: int=None, flow_in=False, flow_out=False, **args) -> None:
+    if tracer is None:
+        return
+    tracer.span(name, start, flow, flow_in, flow_out, **args)
+
+
+def flow_new() -> int:
+    if tracer is None:
+        return None
+    return tracer.flow_new()
+
+
+def flow_start(key: tuple) -> int:
+    if tracer is None:
+        return None
+    return tracer.flow_start(key)
+
+
+def flow_take(key: tuple) -> int:
+    if tracer is None:
+        return None
+    return tracer.flow_take(key)
+
+
+def bind(message: bytes, flows: list[int], owner) -> None:
+    if tracer is None:
+        return
+    tracer.bind(message, flows, owner)
+
+
+def unbind(message: bytes, owner) -> list[int]:
+    """
+    Flows of a message that owner wrote out or dropped
+    """
+    if tracer is None:
+        return ()
+    return tracer.unbind(message, owner)
+
+
+def set_current(flow: int) -> None:
+    if tracer is None:
+        return
+    tracer.set_current(flow)
+
+
+def current() -> int:
+    if tracer is None:
+        return None
+    return tracer.current()
@@ -4,6 +4,7 @@ from gi.repository import Gtk, Adw, GLib
 import time
 from threading import Event
 from boxflat.subscription import SimpleEventDispatcher
+from boxflat import tracing
 
 class BoxflatRow(Adw.ActionRow, SimpleEventDispatcher):
     def __init__(self, title="", subtitle="", init_adw=True):
@@ -84,7 +85,7 @@ class BoxflatRow(Adw.ActionRow, SimpleEventDispatcher):
             # print("Still cooling down")
             return
 
-        GLib.idle_add(self.__set_value_helper, value, mute)
+        GLib.idle_add(self.__set_value_helper, value, mute, tracing.current())
 
 
     def set_value_directly(self, value):
@@ -94,12 +95,14 @@ class BoxflatRow(Adw.ActionRow, SimpleEventDispatcher):
         self.__set_value_helper(value, mute=False)
 
 
-    def __set_value_helper(self, value, mute: bool=True):
+    def __set_value_helper(self, value, mute: bool=True, flow: int=None):
+        start = tracing.now()
         if mute:
             self._mute.set()
         self._set_value(value)
         if mute:
             self._mute.clear()
+        tracing.span("widget-update", start, flow, flow_in=True)
 
 
     def _set_value(self, value):
@@ -115,7 +118,15 @@ class BoxflatRow(Adw.ActionRow, SimpleEventDispatcher):
             return
 
         self._cooldown = self._cooldown_increment
+        start = tracing.now()
+
+        # Writes caused by this change continue its flow
+        flow = tracing.flow_new()
+        previous = tracing.current()
+        tracing.set_current(flow)
         self._dispatch(self.get_value())
+        tracing.set_current(previous)
+        tracing.span("row-notify", start, flow, flow_out=True)
 
 
     def set_expression(self, expr: str):
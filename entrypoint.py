@@ -11,6 +11,10 @@ parser.add_argument("--data-path", help="Use arbitrary data path", type=str, req
 parser.add_argument("--flatpak", help="for flatpak usage", action="store_true", required=False)
 parser.add_argument("--custom", help="Enable custom commands entry", action="store_true", required=False)
 parser.add_argument("--autostart", help="For the autostart handling", action="store_true", required=False)
+parser.add_argument("--serial-path", help="Look for serial devices in another directory (e.g. boxflat.simulator)", type=str, default="/dev/serial/by-id")
+parser.add_argument("--record", help="Record serial traffic to a file (replay with python -m boxflat.serial_recorder)", type=str, required=False)
+parser.add_argument("--stats", help="Dump serial stats to a file (- for stdout) on exit and on SIGUSR1", type=str, required=False)
+parser.add_argument("--trace", help="Trace settings from widget to device and back into a Chrome trace file (chrome://tracing, ui.perfetto.dev)", type=str, required=False)
 args = parser.parse_args()
 
 data_path = "/usr/share/boxflat/data"
@@ -35,6 +39,10 @@ box = app.MyApp(data_path,
     args.dry_run,
     args.custom,
     args.autostart,
+    serial_path=args.serial_path,
+    record_path=args.record,
+    stats_path=args.stats,
+    trace_path=args.trace,
     application_id="io.github.lawstorant.boxflat"
 )
 
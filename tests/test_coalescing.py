@@ -0,0 +1,46 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import tempfile
+import unittest
+from time import sleep
+from boxflat.simulator import MozaSimulator
+from boxflat.connection_manager import MozaConnectionManager
+from boxflat.serial_handler import SerialEventLoop
+
+SERIAL_DATA = os.path.join(os.path.dirname(__file__), "..", "data", "serial.yml")
+
+
+class CoalescingTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="boxflat-test-")
+        self.simulator = MozaSimulator(SERIAL_DATA, directory)
+        self.simulator.start()
+
+        self.cm = MozaConnectionManager(SERIAL_DATA, serial_path=directory)
+        self.cm.device_discovery()
+        sleep(0.5)
+
+
+    def tearDown(self):
+        self.cm.shutdown()
+        self.simulator.stop()
+        self.assertEqual(SerialEventLoop.instance().handlers, 0)
+
+
+    def test_coalesced_writes_keep_their_order(self):
+        port = self.simulator.ports["base"]
+        expected = []
+        for i in range(10):
+            self.cm.set_setting(i, "dash-rpm-brightness")
+            self.cm.set_setting([i, 0, 0] * 6, "dash-flag-colors")
+            expected += ["dash-rpm-brightness", "dash-flag-colors"]
+        sleep(0.2)
+
+        written = [name for name, write in port.history if write and name.startswith("dash-")]
+        self.assertEqual(written, expected)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import tempfile
+import unittest
+from threading import Event
+from boxflat.hotplug import SerialHotplugMonitor
+from boxflat.serial_handler import SerialEventLoop
+
+
+class HotplugTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="boxflat-test-")
+        self.called = Event()
+        self.in_notification_thread = None
+        self.monitor = SerialHotplugMonitor(self.directory, self._callback)
+        self.assertTrue(self.monitor.start())
+
+
+    def tearDown(self):
+        self.monitor.stop()
+
+
+    def _callback(self):
+        self.in_notification_thread = SerialEventLoop.in_notification_thread()
+        self.called.set()
+
+
+    def test_discovery_runs_off_the_notification_thread(self):
+        open(os.path.join(self.directory, "usb-Gudsen_Moza_R9_Base-if00"), "w").close()
+
+        self.assertTrue(self.called.wait(1))
+        self.assertFalse(self.in_notification_thread)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import tempfile
+import unittest
+from time import sleep
+from boxflat.simulator import MozaSimulator
+from boxflat.connection_manager import MozaConnectionManager
+from boxflat.serial_handler import SerialEventLoop
+from boxflat.timeouts import RTO_CONCLUSIVE
+
+SERIAL_DATA = os.path.join(os.path.dirname(__file__), "..", "data", "serial.yml")
+
+
+class RoutingTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="boxflat-test-")
+        self.simulator = MozaSimulator(SERIAL_DATA, directory)
+        self.simulator.start()
+
+        self.cm = MozaConnectionManager(SERIAL_DATA, serial_path=directory)
+        self.cm.device_discovery()
+        sleep(0.5)
+
+        self.assertIsNotNone(self.cm.get_setting("dash-rpm-brightness"))
+        self.assertEqual(self.cm.get_routes().get("dash"), "base")
+        self.simulator.ports["base"]._loss = 1.0
+
+
+    def tearDown(self):
+        self.cm.shutdown()
+        self.simulator.stop()
+        self.assertEqual(SerialEventLoop.instance().handlers, 0)
+
+
+    def test_unsupported_command_keeps_route(self):
+        for _ in range(5):
+            self.cm.get_setting("dash-flag-colors")
+            self.cm.get_settings(["dash-flag-colors"])
+
+        self.assertEqual(self.cm.get_routes().get("dash"), "base")
+
+
+    def test_supported_command_drops_route(self):
+        for _ in range(3):
+            self.cm.get_setting("dash-rpm-brightness", timeout=RTO_CONCLUSIVE)
+
+        self.assertNotIn("dash", self.cm.get_routes())
+
+
+    def test_short_timeouts_keep_route(self):
+        for _ in range(5):
+            self.cm.get_setting("dash-rpm-brightness", timeout=RTO_CONCLUSIVE / 4)
+
+        self.assertEqual(self.cm.get_routes().get("dash"), "base")
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import tempfile
+import unittest
+from threading import Thread
+from time import sleep
+from boxflat.simulator import MozaSimulator
+from boxflat.connection_manager import MozaConnectionManager
+from boxflat.serial_handler import SerialEventLoop
+
+SERIAL_DATA = os.path.join(os.path.dirname(__file__), "..", "data", "serial.yml")
+COMMAND = "dash-rpm-display-mode"
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="boxflat-test-")
+        self.simulator = MozaSimulator(SERIAL_DATA, directory)
+        self.simulator.start()
+
+        self.cm = MozaConnectionManager(SERIAL_DATA, serial_path=directory)
+        self.cm.device_discovery()
+        sleep(0.5)
+
+
+    def tearDown(self):
+        self.cm.shutdown()
+        self.simulator.stop()
+        self.assertEqual(SerialEventLoop.instance().handlers, 0)
+
+
+    def _read_from_thread(self, command_name: str, wait: float) -> list:
+        values = []
+        thread = Thread(target=lambda: values.append(self.cm.get_setting(command_name)), daemon=True)
+        thread.start()
+        thread.join(wait)
+        return values
+
+
+    def test_batched_write_in_session_releases(self):
+        with self.cm.session("dash") as dash:
+            dash.set_settings({COMMAND: 1}, wait=True)
+            self.cm.set_settings({COMMAND: 1})
+
+        self.assertEqual(self._read_from_thread(COMMAND, 1), [1])
+
+
+    def test_session_frames_keep_their_order(self):
+        port = self.simulator.ports["base"]
+        expected = []
+        with self.cm.session("dash") as dash:
+            for i in range(20):
+                dash.set_settings({"dash-rpm-value1": i, "dash-rpm-value2": i})
+                dash.set_setting(i, COMMAND)
+                expected += ["dash-rpm-value1", "dash-rpm-value2", COMMAND]
+        sleep(0.2)
+
+        written = [name for name, write in port.history if write and name.startswith("dash-")]
+        self.assertEqual(written, expected)
+
+
+    def test_bulk_read_waits_for_session(self):
+        values = []
+        with self.cm.session("dash"):
+            thread = Thread(target=lambda: values.append(self.cm.get_settings([COMMAND])), daemon=True)
+            thread.start()
+            sleep(0.2)
+            self.assertEqual(values, [])
+
+        thread.join(1)
+        self.assertEqual(len(values), 1)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
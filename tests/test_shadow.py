@@ -0,0 +1,45 @@
+# Copyright (c) 2025, Tomasz Pakuła Using Arch BTW
+
+import os
+import tempfile
+import unittest
+from time import sleep
+from boxflat.simulator import MozaSimulator
+from boxflat.connection_manager import MozaConnectionManager, CM_SHADOW_MAX_AGE
+from boxflat.serial_handler import SerialEventLoop
+
+SERIAL_DATA = os.path.join(os.path.dirname(__file__), "..", "data", "serial.yml")
+COMMANDS = ["dash-rpm-brightness", "dash-flags-brightness"]
+
+
+class ShadowTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="boxflat-test-")
+        self.simulator = MozaSimulator(SERIAL_DATA, directory)
+        self.simulator.start()
+
+        self.cm = MozaConnectionManager(SERIAL_DATA, serial_path=directory)
+        self.cm.device_discovery()
+        sleep(0.5)
+
+
+    def tearDown(self):
+        self.cm.shutdown()
+        self.simulator.stop()
+        self.assertEqual(SerialEventLoop.instance().handlers, 0)
+
+
+    def test_fresh_values_are_not_read_again(self):
+        values = self.cm.get_settings(COMMANDS)
+        self.assertNotIn(None, values.values())
+
+        port = self.simulator.ports["base"]
+        received = port.frames_received
+        self.assertEqual(self.cm.get_settings(COMMANDS, max_age=CM_SHADOW_MAX_AGE), values)
+        self.assertEqual(self.cm.get_setting(COMMANDS[0], max_age=CM_SHADOW_MAX_AGE), values[COMMANDS[0]])
+        self.assertEqual(port.frames_received, received)
+
+
+
+if __name__ == "__main__":
+    unittest.main()